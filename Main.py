@@ -20,12 +20,28 @@ from config import SECRET_KEY, UPLOAD_FOLDER, DB_PATH, ALLOWED_EXTENSIONS, MAX_I
 import models
 
 # Configuration
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=7)
+# Let the front-end server stream image files named in an X-Sendfile header
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+# Refuse request bodies (i.e. uploads) larger than this before reading them
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 10))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+# Hand pooled database connections back at the end of every request
+models.init_app(app)
+# Per-request SQL timing (logged at a sample rate, headers in debug mode)
+import instrumentation
+instrumentation.init_app(app)
+# Item images: template helper and background processing of uploads
+import images
+import image_worker
+app.add_template_global(images.image_url)
+app.add_template_global(images.image_srcset)
+image_worker.init_app(app)
 # Mail configuration
 app.config.update(
     MAIL_SERVER=MAIL_SERVER,
@@ -63,11 +79,19 @@ def load_user(user_id):
 from blueprints.auth import auth_bp
 from blueprints.lost_and_found import lost_and_found_bp
 from blueprints.marketplace import marketplace_bp
+from blueprints.media import media_bp
+from blueprints.alerts import alerts_bp
+from blueprints.autocomplete import autocomplete_bp
+from blueprints.api import api_bp
 
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(lost_and_found_bp)
 app.register_blueprint(marketplace_bp)
+app.register_blueprint(media_bp)
+app.register_blueprint(alerts_bp)
+app.register_blueprint(autocomplete_bp)
+app.register_blueprint(api_bp)
 
 @app.route('/')
 def index():
@@ -82,22 +106,31 @@ def inject_user_info():
     if current_user.is_authenticated:
         user = models.get_user_by_id(current_user.id)
         if user:
-            return {'get_user_info': lambda: user}
-    return {'get_user_info': lambda: None}
+            return {'get_user_info': lambda: user,
+                    'unread_notifications': lambda: models.count_unread_notifications(user['id'])}
+    return {'get_user_info': lambda: None, 'unread_notifications': lambda: 0}
 
 # Handle 404 errors
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
+# Handle uploads over MAX_CONTENT_LENGTH
+@app.errorhandler(413)
+def upload_too_large(e):
+    instrumentation.count('upload_rejected', 'too_large')
+    flash(f'Uploads are limited to {MAX_UPLOAD_MB} MB.', 'danger')
+    return redirect(request.url)
+
 # Handle 500 errors
 @app.errorhandler(500)
 def server_error(e):
     return render_template('500.html'), 500
 
 if __name__ == '__main__':
-    # Ensure database is initialized
+    # Ensure database is initialized and warm the category registry
     models.init_db()
+    models.load_categories()
     
     # Create upload folder if it doesn't exist
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
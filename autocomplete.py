@@ -0,0 +1,140 @@
+"""Typeahead suggestions for item names, locations and categories.
+
+Suggestions come from an in-memory prefix index over the values already
+used in both item tables.  Every value is filed under each of its words,
+so "LHC" finds "LHC 2nd floor" and "lib" finds "Central Library".  The keys
+are kept in one sorted list per field, and a lookup is a ``bisect`` to the
+first key with the typed prefix followed by a short forward scan.  Values
+are ranked by how many items use them.
+
+The index is built from the item tables on first use and then kept current
+from the suggest_change log, which triggers on both tables fill on every
+insert, edit and delete.  At most every AUTOCOMPLETE_RECHECK_SECONDS a
+lookup applies the log rows it has not seen yet, adding or removing only
+the values they touch.
+"""
+import bisect
+import os
+import re
+import threading
+import time
+
+import models
+import tokens
+
+AUTOCOMPLETE_RECHECK_SECONDS = float(os.environ.get('AUTOCOMPLETE_RECHECK_SECONDS', 1))
+SUGGESTION_LIMIT = 8
+# Matching values looked at before ranking, bounding the cost of short prefixes
+SCAN_LIMIT = 200
+
+_SPACE = re.compile(r'\s+')
+_WORD_START = re.compile(r'(?<![a-z0-9])[a-z0-9]')
+
+
+def normalize(value):
+    """Case-fold, strip accents and collapse whitespace."""
+    return _SPACE.sub(' ', tokens.normalize(value)).strip()
+
+
+class PrefixIndex:
+    """Values of one field, findable by a prefix of any of their words."""
+
+    def __init__(self):
+        # Sorted (key, value) pairs, a key being the value from one word on
+        self.keys = []
+        self.counts = {}
+        self.labels = {}
+
+    @staticmethod
+    def _keys(value):
+        return [(value[m.start():], value) for m in _WORD_START.finditer(value)]
+
+    def add(self, label, delta=1):
+        """Count ``delta`` more (or, if negative, fewer) items using ``label``."""
+        value = normalize(label)
+        if not value:
+            return
+        count = self.counts.get(value, 0) + delta
+        if count > 0:
+            if value not in self.counts:
+                for key in self._keys(value):
+                    bisect.insort(self.keys, key)
+                self.labels[value] = label.strip()
+            self.counts[value] = count
+        elif value in self.counts:
+            for key in self._keys(value):
+                i = bisect.bisect_left(self.keys, key)
+                if i < len(self.keys) and self.keys[i] == key:
+                    del self.keys[i]
+            del self.counts[value]
+            del self.labels[value]
+
+    def build(self, labels):
+        """Replace the contents with ``labels``, one per item."""
+        self.keys, self.counts, self.labels = [], {}, {}
+        for label in labels:
+            value = normalize(label)
+            if not value:
+                continue
+            if value not in self.counts:
+                self.counts[value] = 0
+                self.labels[value] = label.strip()
+            self.counts[value] += 1
+        self.keys = sorted(key for value in self.counts for key in self._keys(value))
+
+    def suggest(self, prefix, limit=SUGGESTION_LIMIT):
+        """The most used values with a word starting with ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = {}
+        i = bisect.bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(found) < SCAN_LIMIT:
+            key, value = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            # A value whose first word matches ranks above one matching later on
+            found[value] = max(found.get(value, False), key == value)
+            i += 1
+        ranked = sorted(found, key=lambda value: (not found[value], -self.counts[value], len(value), value))
+        return [self.labels[value] for value in ranked[:limit]]
+
+
+_indexes = {field: PrefixIndex() for field in models.SUGGEST_FIELDS}
+_state = {'last_id': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def _rebuild():
+    rows, last_id = models.get_suggest_snapshot()
+    for position, field in enumerate(models.SUGGEST_FIELDS):
+        _indexes[field].build(row[position] for row in rows if row[position])
+    _state['last_id'] = last_id
+
+
+def refresh():
+    """Bring the index up to date with the item tables."""
+    with _lock:
+        if _state['last_id'] is None:
+            _rebuild()
+        else:
+            changes = models.get_suggest_changes(_state['last_id'])
+            if changes is None:
+                # Fell behind the pruned log
+                _rebuild()
+            else:
+                for change_id, field, value, delta in changes:
+                    if field in _indexes:
+                        _indexes[field].add(value, delta)
+                    _state['last_id'] = change_id
+        _state['checked_at'] = time.monotonic()
+
+
+def suggest(field, prefix, limit=SUGGESTION_LIMIT):
+    """Suggest up to ``limit`` values of ``field`` ('name', 'location' or 'category') for ``prefix``."""
+    if field not in _indexes:
+        return []
+    if _state['last_id'] is None or time.monotonic() - _state['checked_at'] > AUTOCOMPLETE_RECHECK_SECONDS:
+        refresh()
+    with _lock:
+        return _indexes[field].suggest(prefix, limit)
@@ -0,0 +1,112 @@
+"""Benchmark JSON API encoding: msgspec Structs against flask.jsonify.
+
+Builds dashboard pages of synthetic lost & found and marketplace rows,
+shaped like the dicts the model functions return, and times turning one
+page into a response body both ways:
+
+* jsonify: ``flask.jsonify`` of the page dict, as a plain Flask JSON view
+  would do it;
+* msgspec: what the API blueprint does, converting the rows into its
+  Structs (validating them and dropping unlisted columns) and encoding
+  them with ``msgspec.json``.
+
+It also times decoding and validating a feedback request body with the
+API's ``FeedbackIn`` decoder against ``json.loads`` plus the equivalent
+checks by hand.
+
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --page-sizes 24 100 500 --repeat 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def lost_found_row(i, rng):
+    return {
+        'id': i, 'name': f'Blue water bottle {i}', 'description': 'Steel bottle with a dent near the cap ' * 2,
+        'category': rng.choice(['electronics', 'accessories', 'documents']),
+        'status': rng.choice(['lost', 'found']), 'priority': rng.randint(1, 3),
+        'image_path': f'/images/ab/cd/{i:064x}.jpg', 'image_status': 'ready', 'image_variants': None,
+        'image_hash': rng.getrandbits(63), 'date': '2024-08-01T10:00', 'location': 'Central Library',
+        'contact_info': '9999999999', 'latitude': 25.43 + rng.random() / 100, 'longitude': 81.77,
+        'user_id': 7, 'found_by': None, 'claimed_by': None, 'username': 'alice',
+        'found_by_user': None, 'claimed_by_user': None,
+        'image_url': f'/media/images/ab/cd/{i:064x}.jpg',
+    }
+
+
+def marketplace_row(i, rng):
+    return {
+        'id': i, 'name': f'Calculus textbook {i}', 'description': 'Lightly used, a few notes in pencil',
+        'price': round(rng.uniform(50, 5000), 2), 'category': 'textbooks', 'condition': 'good',
+        'status': 'available', 'image_path': f'/images/ab/cd/{i:064x}.png', 'image_status': 'ready',
+        'image_variants': None, 'image_hash': None, 'date': '2024-08-01', 'location': 'Hostel 3',
+        'contact_info': '9999999999', 'user_id': 7, 'username': 'bob',
+        'image_url': f'/media/images/ab/cd/{i:064x}.png',
+    }
+
+
+def validate_feedback_by_hand(body):
+    data = json.loads(body)
+    if not isinstance(data, dict) or set(data) != {'comment'}:
+        raise ValueError('bad fields')
+    comment = data['comment']
+    if not isinstance(comment, str) or not 1 <= len(comment) <= 2000:
+        raise ValueError('bad comment')
+    return comment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[24, 100], help='rows per page (default 24 100)')
+    parser.add_argument('--repeat', type=int, default=1000, help='timed runs per case (default 1000)')
+    args = parser.parse_args()
+
+    import msgspec
+    from flask import Flask, jsonify
+    from blueprints.api import schemas
+    from blueprints.api.routes import _encoder, _feedback_decoder
+
+    app = Flask(__name__)
+    rng = random.Random(0)
+    cases = [('lost_found', lost_found_row, schemas.LostFoundItem, schemas.LostFoundPage),
+             ('marketplace', marketplace_row, schemas.MarketplaceItem, schemas.MarketplacePage)]
+
+    header = f"{'case':<22} {'jsonify us':>11} {'msgspec us':>11} {'speedup':>8} {'jsonify B':>10} {'msgspec B':>10}"
+    print(header)
+    print('-' * len(header))
+    with app.app_context():
+        for name, make_row, item_schema, page_schema in cases:
+            for size in args.page_sizes:
+                rows = [make_row(i, rng) for i in range(size)]
+                page = {'items': rows, 'next_cursor': 'WzEsMl0', 'prev_cursor': None}
+
+                def with_jsonify():
+                    return jsonify(page).get_data()
+
+                def with_msgspec():
+                    items = msgspec.convert(rows, list[item_schema], strict=False)
+                    return _encoder.encode(page_schema(items, page['next_cursor'], page['prev_cursor']))
+
+                slow = min(timeit.repeat(with_jsonify, number=args.repeat, repeat=3)) / args.repeat * 1e6
+                fast = min(timeit.repeat(with_msgspec, number=args.repeat, repeat=3)) / args.repeat * 1e6
+                print(f"{name + ' x' + str(size):<22} {slow:>11.1f} {fast:>11.1f} {slow / fast:>7.1f}x "
+                      f"{len(with_jsonify()):>10} {len(with_msgspec()):>10}")
+
+    body = json.dumps({'comment': 'Is this still available? I can pick it up today.'}).encode()
+    slow = min(timeit.repeat(lambda: validate_feedback_by_hand(body), number=args.repeat * 10, repeat=3))
+    fast = min(timeit.repeat(lambda: _feedback_decoder.decode(body), number=args.repeat * 10, repeat=3))
+    scale = 1e6 / (args.repeat * 10)
+    print(f"{'feedback decode':<22} {slow * scale:>11.2f} {fast * scale:>11.2f} {slow / fast:>7.1f}x")
+    print("\njsonify bytes include every column the models return; the API's schemas list only the public ones.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Benchmark the upload image pipeline.
+
+Generates a corpus of photo-like images at the resolutions and formats
+phones and messaging apps produce (plus the sample files in static/images)
+and runs each one through the step the image worker performs for
+``report``/``create`` uploads, ``images.process_upload`` (or, with
+``--pipeline single``, the single-output ``images.process_image``).
+
+For every kind of input it reports per-image latency percentiles, the
+process's peak RSS and the bytes written.  Each kind runs in a fresh child
+process so the RSS figure is that kind's alone; the child's RSS before it
+starts is shown as the baseline.  Results can be saved with ``--save`` and
+compared against an earlier run with ``--compare``:
+
+    python benchmarks/bench_images.py --save before.json
+    # ... change the image code ...
+    python benchmarks/bench_images.py --compare before.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (name, size, format, Pillow save options)
+KINDS = [
+    ('jpeg-12mp', (4032, 3024), 'JPEG', {'quality': 92}),
+    ('jpeg-12mp-portrait', (3024, 4032), 'JPEG', {'quality': 92}),
+    ('jpeg-48mp', (8064, 6048), 'JPEG', {'quality': 90}),
+    ('png-screenshot', (1170, 2532), 'PNG', {}),
+    ('png-12mp', (4032, 3024), 'PNG', {}),
+    ('webp-chat', (1600, 1200), 'WEBP', {'quality': 80}),
+    ('webp-12mp', (4032, 3024), 'WEBP', {'quality': 85}),
+]
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+SAMPLE_DIR = os.path.join(ROOT, 'static', 'images')
+
+
+def synthetic_image(size, seed):
+    """A photo-like image: smooth colour regions with fine sensor-style noise."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    base = Image.fromarray((rng.random((height // 64 + 2, width // 64 + 2, 3)) * 255).astype('uint8'))
+    img = base.resize(size, Image.BICUBIC)
+    noise = rng.normal(0, 6, (height, width, 3))
+    return Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype('uint8'))
+
+
+def build_corpus(corpus_dir, per_kind, kinds):
+    """Write ``per_kind`` images of each kind (reusing existing files); return {kind: [paths]}."""
+    corpus = {}
+    for name, size, fmt, options in KINDS:
+        if name not in kinds:
+            continue
+        paths = []
+        for i in range(per_kind):
+            path = os.path.join(corpus_dir, f'{name}-{i}{EXTENSIONS[fmt]}')
+            if not os.path.exists(path):
+                synthetic_image(size, seed=i).save(path, fmt, **options)
+            paths.append(path)
+        corpus[name] = paths
+    if 'samples' in kinds and os.path.isdir(SAMPLE_DIR):
+        corpus['samples'] = sorted(
+            os.path.join(SAMPLE_DIR, f) for f in os.listdir(SAMPLE_DIR)
+            if os.path.splitext(f)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp'))
+    return corpus
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    # Linux's ru_maxrss survives exec, so a child would report its parent's
+    # peak; VmHWM belongs to the process's own address space
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_kind(paths, pipeline, repeat, out_dir):
+    """Process ``paths`` in this (child) process; return timings, output bytes and RSS."""
+    import images
+
+    images.UPLOAD_FOLDER = out_dir
+    os.makedirs(out_dir, exist_ok=True)
+    baseline_rss = peak_rss_mb()
+    timings, output_bytes = [], []
+    for _ in range(repeat):
+        for i, path in enumerate(paths):
+            image_path = f'/images/bench-{i}{os.path.splitext(path)[1].lower()}'
+            start = time.perf_counter()
+            if pipeline == 'upload':
+                variants, _ = images.process_upload(path, image_path)
+                written = {image_path} | {p for sizes in variants.values() for _, p in sizes}
+            else:
+                images.process_image(path, images.upload_file(image_path))
+                written = {image_path}
+            timings.append((time.perf_counter() - start) * 1000)
+            output_bytes.append(sum(os.path.getsize(images.upload_file(p)) for p in written))
+    return {
+        'count': len(timings),
+        'input_bytes': sum(os.path.getsize(p) for p in paths) // len(paths),
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'mean_ms': statistics.fmean(timings),
+        'output_bytes': sum(output_bytes) // len(output_bytes),
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def print_table(results, baseline=None):
+    header = f"{'kind':<20} {'n':>4} {'in KB':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'out KB':>8} {'RSS MB':>14}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        line = (f"{name:<20} {r['count']:>4} {r['input_bytes'] / 1024:>8.0f} {r['p50_ms']:>8.1f} "
+                f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['output_bytes'] / 1024:>8.1f} "
+                f"{r['peak_rss_mb']:>6.0f} (+{r['peak_rss_mb'] - r['baseline_rss_mb']:.0f})")
+        print(line)
+        old = (baseline or {}).get(name)
+        if old:
+            print(f"{'  vs baseline':<20} {'':>4} {'':>8} {_delta(r, old, 'p50_ms')} {_delta(r, old, 'p95_ms')} "
+                  f"{_delta(r, old, 'p99_ms')} {_delta(r, old, 'output_bytes')} {_delta(r, old, 'peak_rss_mb'):>14}")
+
+
+def _delta(new, old, key):
+    if not old.get(key):
+        return f"{'n/a':>8}"
+    return f"{(new[key] - old[key]) / old[key] * 100:>+7.0f}%"
+
+
+def main():
+    kind_names = [name for name, *_ in KINDS] + ['samples']
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pipeline', choices=['upload', 'single'], default='upload',
+                        help='process_upload with derivatives (default) or process_image alone')
+    parser.add_argument('--per-kind', type=int, default=5, help='generated images per kind (default 5)')
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the corpus (default 3)')
+    parser.add_argument('--kinds', nargs='+', choices=kind_names, default=kind_names, metavar='KIND',
+                        help=f"kinds to run (default all: {', '.join(kind_names)})")
+    parser.add_argument('--corpus', metavar='DIR', help='keep the generated corpus here and reuse it')
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='show changes against results saved earlier')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='bench_images_')
+    corpus_dir = args.corpus or os.path.join(scratch, 'corpus')
+    os.makedirs(corpus_dir, exist_ok=True)
+    try:
+        print(f"Building corpus in {corpus_dir}...")
+        corpus = build_corpus(corpus_dir, args.per_kind, args.kinds)
+        results = {}
+        # A fresh interpreter per kind keeps each peak RSS independent
+        ctx = multiprocessing.get_context('spawn')
+        for name, paths in corpus.items():
+            if not paths:
+                continue
+            out_dir = os.path.join(scratch, 'out', name)
+            with ctx.Pool(1) as pool:
+                results[name] = pool.apply(run_kind, (paths, args.pipeline, args.repeat, out_dir))
+            print(f"  {name}: done")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print(f"\nPipeline: {args.pipeline}")
+    print_table(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'pipeline': args.pipeline, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+alerts_bp = Blueprint('alerts', __name__, url_prefix='/alerts')
+
+# Import routes to register them with the blueprint
+from . import routes
\ No newline at end of file
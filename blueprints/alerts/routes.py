@@ -0,0 +1,66 @@
+from flask import render_template, redirect, url_for, request, flash, jsonify
+from flask_login import login_required, current_user
+
+from . import alerts_bp
+import models
+import notifications
+import saved_searches
+
+DASHBOARDS = {'lost_found': 'lost_and_found.dashboard', 'marketplace': 'marketplace.dashboard'}
+
+@alerts_bp.route('/')
+@login_required
+def index():
+    searches = models.get_saved_searches(current_user.id)
+    for search in searches:
+        search['summary'] = saved_searches.describe(search)
+    items = models.get_notifications(current_user.id)
+    for note in items:
+        note['url'] = notifications.item_url(note['item_type'], note['item_id'])
+    # Opening the page counts as reading everything on it
+    models.mark_notifications_read(current_user.id)
+    return render_template('alerts/index.html',
+                           user=models.get_user_by_id(current_user.id),
+                           searches=searches,
+                           notifications=items)
+
+@alerts_bp.route('/save', methods=['POST'])
+@login_required
+def save_search():
+    form = request.form
+    item_type = form.get('item_type')
+    if item_type not in DASHBOARDS:
+        flash('Unknown search type', 'danger')
+        return redirect(url_for('alerts.index'))
+    radius = models.parse_coordinate(form.get('radius'))
+    search_id = saved_searches.save_search(
+        current_user.id, item_type,
+        query=form.get('q'),
+        category=form.get('category'),
+        status=form.get('status'),
+        latitude=models.parse_coordinate(form.get('lat')),
+        longitude=models.parse_coordinate(form.get('lon')),
+        radius_m=min(radius, models.NEAR_ME_MAX_RADIUS_M) if radius and radius > 0 else None,
+    )
+    if search_id:
+        flash("Search saved. You'll be notified when a new item matches it.", 'success')
+    else:
+        flash('Error saving search. Please try again.', 'danger')
+    # Back to the search that was saved
+    query_args = {k: v for k, v in form.items() if v and k in ('q', 'category', 'status', 'lat', 'lon', 'radius')}
+    return redirect(url_for(DASHBOARDS[item_type], **query_args))
+
+@alerts_bp.route('/delete/<int:search_id>', methods=['POST'])
+@login_required
+def delete_search(search_id):
+    if models.delete_saved_search(search_id, current_user.id):
+        flash('Saved search deleted', 'success')
+    else:
+        flash('Saved search not found', 'danger')
+    return redirect(url_for('alerts.index'))
+
+@alerts_bp.route('/unread')
+@login_required
+def unread():
+    # A cheap count for pages that poll instead of rendering a dashboard
+    return jsonify(unread=models.count_unread_notifications(current_user.id))
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Import routes to register them with the blueprint
+from . import routes
\ No newline at end of file
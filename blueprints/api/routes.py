@@ -0,0 +1,151 @@
+from flask import Response, current_app, request
+from flask_login import current_user
+from functools import wraps
+import msgspec
+
+from . import api_bp
+from .schemas import (LostFoundItem, MarketplaceItem, LostFoundPage, MarketplacePage, Feedback, FeedbackIn,
+                      Error, LostFoundQuery, MarketplaceQuery)
+import models
+import images
+
+_encoder = msgspec.json.Encoder()
+_feedback_decoder = msgspec.json.Decoder(FeedbackIn)
+
+def _respond(obj, status=200):
+    return Response(_encoder.encode(obj), status=status, mimetype='application/json')
+
+def _error(message, status):
+    return _respond(Error(message), status)
+
+def login_required(view):
+    """Like flask_login's, but answers 401 instead of redirecting to the login page."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return _error('Login required', 401)
+        return view(*args, **kwargs)
+    return wrapped
+
+class InvalidRequest(Exception):
+    """The query string or body did not validate.
+
+    Only ``_query_args`` and ``_decode_feedback`` raise it, so a msgspec
+    error while building a response still surfaces as a 500.
+    """
+
+def _query_args(schema):
+    """Validate the query string against ``schema``; blank parameters count as absent."""
+    args = {key: value for key, value in request.args.items() if value != ''}
+    try:
+        parsed = msgspec.convert(args, schema, strict=False)
+    except msgspec.ValidationError as e:
+        raise InvalidRequest(str(e)) from e
+    for name in ('after', 'before'):
+        if getattr(parsed, name) and models.decode_cursor(getattr(parsed, name)) is None:
+            raise InvalidRequest(f'Invalid cursor - at `$.{name}`')
+    return parsed
+
+def _decode_feedback():
+    """Decode and validate a feedback request body."""
+    try:
+        return _feedback_decoder.decode(request.get_data())
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        raise InvalidRequest(str(e)) from e
+
+def _convert(rows, schema):
+    """Convert item rows to ``schema``, adding each one's image URL.
+
+    Older rows store a missing coordinate as '', which is reported as null.
+    """
+    for row in rows:
+        row['image_url'] = images.image_url(row)
+        for field in ('latitude', 'longitude', 'distance_m'):
+            if field in row and not models.is_coordinate(row[field]):
+                row[field] = None
+    return msgspec.convert(rows, list[schema], strict=False)
+
+@api_bp.errorhandler(InvalidRequest)
+def invalid_request(e):
+    return _error(str(e), 400)
+
+@api_bp.errorhandler(413)
+def body_too_large(e):
+    # The app-wide handler flashes and redirects, which means nothing to an API client
+    limit_mb = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return _error(f'Request bodies are limited to {limit_mb} MB', 413)
+
+# Lost & found
+@api_bp.route('/lost')
+@login_required
+def lost_found_list():
+    args = _query_args(LostFoundQuery)
+    filters = {'status': args.status, 'priority': args.priority, 'category': args.category}
+    if args.lat is not None and args.lon is not None:
+        # "Near me": nearest first, a single page
+        items = models.get_lost_found_items_near(args.lat, args.lon, args.radius, filters, limit=args.limit,
+                                                 text=args.q)
+        page = {'items': items, 'next_cursor': None, 'prev_cursor': None}
+    elif args.q.strip():
+        page = models.search_lost_found_items(args.q, filters, after=args.after, before=args.before,
+                                              limit=args.limit)
+    else:
+        page = models.get_lost_found_page(args.sort, filters, after=args.after, before=args.before,
+                                          limit=args.limit)
+    return _respond(LostFoundPage(_convert(page['items'], LostFoundItem), page['next_cursor'], page['prev_cursor']))
+
+@api_bp.route('/lost/<int:item_id>')
+@login_required
+def lost_found_detail(item_id):
+    item = models.get_lost_found_item(item_id)
+    if not item:
+        return _error('Item not found', 404)
+    return _respond(_convert([item], LostFoundItem)[0])
+
+# Marketplace
+@api_bp.route('/market')
+@login_required
+def marketplace_list():
+    args = _query_args(MarketplaceQuery)
+    filters = {'status': args.status, 'category': args.category, 'condition': args.condition,
+               'min_price': args.min_price, 'max_price': args.max_price}
+    if args.q.strip():
+        page = models.search_marketplace_items(args.q, filters, after=args.after, before=args.before,
+                                               limit=args.limit, order=args.sort)
+    else:
+        page = models.get_marketplace_page(args.sort or 'date', filters, after=args.after, before=args.before,
+                                           limit=args.limit)
+    return _respond(MarketplacePage(_convert(page['items'], MarketplaceItem), page['next_cursor'], page['prev_cursor']))
+
+@api_bp.route('/market/<int:item_id>')
+@login_required
+def marketplace_detail(item_id):
+    item = models.get_marketplace_item(item_id)
+    if not item:
+        return _error('Item not found', 404)
+    return _respond(_convert([item], MarketplaceItem)[0])
+
+# Feedback on either kind of item
+ITEM_GETTERS = {'lost': ('lost_found', models.get_lost_found_item),
+                'market': ('marketplace', models.get_marketplace_item)}
+
+@api_bp.route('/<any(lost, market):kind>/<int:item_id>/feedback')
+@login_required
+def feedback_list(kind, item_id):
+    item_type, get_item = ITEM_GETTERS[kind]
+    if not get_item(item_id):
+        return _error('Item not found', 404)
+    feedback = models.get_feedback_for_item(item_type, item_id)
+    return _respond(msgspec.convert(feedback, list[Feedback], strict=False))
+
+@api_bp.route('/<any(lost, market):kind>/<int:item_id>/feedback', methods=['POST'])
+@login_required
+def feedback_create(kind, item_id):
+    item_type, get_item = ITEM_GETTERS[kind]
+    if not get_item(item_id):
+        return _error('Item not found', 404)
+    body = _decode_feedback()
+    feedback_id = models.create_feedback(current_user.id, item_type, item_id, body.comment)
+    if not feedback_id:
+        return _error('Could not save feedback', 500)
+    return _respond(msgspec.convert(models.get_feedback(feedback_id), Feedback, strict=False), 201)
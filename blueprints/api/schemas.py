@@ -0,0 +1,108 @@
+"""msgspec schemas for the JSON API.
+
+Responses are built by converting model rows (dicts) into these Structs,
+which drops any column not listed here, and encoding them with
+``msgspec.json``.  Query strings and request bodies are decoded into the
+``*Query``/``*In`` Structs, whose constraints do the validation.
+"""
+from typing import Annotated, Literal, Optional
+
+import msgspec
+
+import models
+
+Limit = Annotated[int, msgspec.Meta(ge=1, le=100)]
+Price = Annotated[float, msgspec.Meta(ge=0)]
+
+
+class LostFoundItem(msgspec.Struct):
+    id: int
+    name: str
+    description: Optional[str]
+    category: Optional[str]
+    status: str
+    priority: int
+    date: str
+    location: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    user_id: int
+    username: str
+    image_status: str
+    image_url: Optional[str]
+    found_by_user: Optional[str] = None
+    claimed_by_user: Optional[str] = None
+    distance_m: Optional[float] = None
+
+
+class MarketplaceItem(msgspec.Struct):
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+    category: Optional[str]
+    condition: Optional[str]
+    status: str
+    date: str
+    location: Optional[str]
+    user_id: int
+    username: str
+    image_status: str
+    image_url: Optional[str]
+
+
+class LostFoundPage(msgspec.Struct):
+    items: list[LostFoundItem]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+class MarketplacePage(msgspec.Struct):
+    items: list[MarketplaceItem]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+class Feedback(msgspec.Struct):
+    id: int
+    user_id: int
+    username: str
+    comment: Optional[str]
+    date: str
+
+
+class FeedbackIn(msgspec.Struct, forbid_unknown_fields=True):
+    comment: Annotated[str, msgspec.Meta(min_length=1, max_length=2000)]
+
+
+class Error(msgspec.Struct):
+    error: str
+
+
+class LostFoundQuery(msgspec.Struct):
+    q: str = ''
+    status: Optional[Literal['lost', 'found', 'claimed']] = None
+    priority: Optional[Annotated[int, msgspec.Meta(ge=1, le=3)]] = None
+    category: Optional[str] = None
+    sort: Literal['date', 'priority'] = 'date'
+    # "Near me": both coordinates switch to a distance search without paging
+    lat: Optional[Annotated[float, msgspec.Meta(ge=-90, le=90)]] = None
+    lon: Optional[Annotated[float, msgspec.Meta(ge=-180, le=180)]] = None
+    radius: Annotated[float, msgspec.Meta(gt=0, le=models.NEAR_ME_MAX_RADIUS_M)] = models.NEAR_ME_RADIUS_M
+    after: Optional[str] = None
+    before: Optional[str] = None
+    limit: Limit = models.PAGE_SIZE
+
+
+class MarketplaceQuery(msgspec.Struct):
+    q: str = ''
+    status: Optional[Literal['available', 'sold']] = None
+    category: Optional[str] = None
+    condition: Optional[str] = None
+    min_price: Optional[Price] = None
+    max_price: Optional[Price] = None
+    # Relevance when searching, newest otherwise
+    sort: Optional[Literal['date', 'price_asc', 'price_desc']] = None
+    after: Optional[str] = None
+    before: Optional[str] = None
+    limit: Limit = models.PAGE_SIZE
@@ -9,6 +9,7 @@ from config import SECRET_KEY, MAIL_USERNAME
 
 from . import auth_bp
 import models
+import image_worker
 
 serializer = URLSafeTimedSerializer(SECRET_KEY)
 
@@ -153,6 +154,7 @@ def profile():
 
             if item and (item['user_id'] == current_user.id or user['is_admin']):
                 if models.delete_lost_found_item(item_id):
+                    image_worker.release_image(item['image_path'])
                     flash('Item deleted successfully.', 'success')
                 else:
                     flash('Failed to delete item.', 'danger')
@@ -167,6 +169,7 @@ def profile():
 
             if item and (item['user_id'] == current_user.id or user['is_admin']):
                 if models.delete_marketplace_item(item_id):
+                    image_worker.release_image(item['image_path'])
                     flash('Item deleted successfully.', 'success')
                 else:
                     flash('Failed to delete item.', 'danger')
@@ -224,7 +227,7 @@ def update_profile():
         update_data['password'] = hashed_new
 
     if update_data:
-        if update_user_profile(user['id'], update_data):
+        if models.update_user_profile(user['id'], update_data):
             flash('Profile updated successfully', 'success')
         else:
             flash('Error updating profile', 'danger')
@@ -232,27 +235,3 @@ def update_profile():
         flash('No changes made', 'info')
 
     return redirect(url_for('auth.profile'))
-
-def update_user_profile(user_id, update_data):
-    conn = models.get_db_connection()
-    cur = conn.cursor()
-
-    update_fields = []
-    update_values = []
-
-    for key, value in update_data.items():
-        update_fields.append(f"{key} = ?")
-        update_values.append(value)
-
-    update_values.append(user_id)
-
-    try:
-        query = f"UPDATE user SET {', '.join(update_fields)} WHERE id = ?"
-        cur.execute(query, update_values)
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error updating user profile: {e}")
-        return False
-    finally:
-        conn.close()
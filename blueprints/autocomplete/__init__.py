@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+autocomplete_bp = Blueprint('autocomplete', __name__, url_prefix='/autocomplete')
+
+# Import routes to register them with the blueprint
+from . import routes
\ No newline at end of file
@@ -0,0 +1,16 @@
+from flask import request, jsonify
+from flask_login import login_required
+
+from . import autocomplete_bp
+import autocomplete
+import models
+
+@autocomplete_bp.route('/<field>')
+@login_required
+def suggest(field):
+    if field not in models.SUGGEST_FIELDS:
+        return jsonify(error='Unknown field'), 404
+    response = jsonify(autocomplete.suggest(field, request.args.get('q', '')))
+    # Typing the same prefix again within a minute needs no round trip
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
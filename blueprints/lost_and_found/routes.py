@@ -1,9 +1,6 @@
 from flask import render_template, redirect, url_for, request, flash
 from flask_login import login_required, current_user
-import os
-from werkzeug.utils import secure_filename
 from datetime import datetime
-from PIL import Image, ImageStat
 import re
 from flask_mail import Message
 from extensions import mail
@@ -11,37 +8,63 @@ from config import MAIL_USERNAME
 
 from . import lost_and_found_bp
 import models
-from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_IMAGE_SIZE, QUALITY, allowed_file
+import images
+import image_worker
+import image_match
+import matching
+import saved_searches
+from conditional import conditional
+from config import ALLOWED_EXTENSIONS, allowed_file
 
 @lost_and_found_bp.route('/')
 @login_required
+@conditional(lambda: models.get_data_versions('lost_found_item', 'category'))
 def dashboard():
-    # Get all lost and found items
-    items = models.get_lost_found_items('date DESC')
-    # Attach finder/claimer usernames
-    for item in items:
-        if item.get('found_by'):
-            item['found_by_user'] = models.get_user_by_id(item['found_by'])['username']
-        else:
-            item['found_by_user'] = None
-        if item.get('claimed_by'):
-            item['claimed_by_user'] = models.get_user_by_id(item['claimed_by'])['username']
-        else:
-            item['claimed_by_user'] = None
-    items_prior = models.get_lost_found_items('priority DESC')
+    # Search text, filters, sort order and page cursor come from the query string
+    filters = {
+        'status': request.args.get('status'),
+        'priority': request.args.get('priority'),
+        'category': request.args.get('category'),
+    }
+    order = request.args.get('sort', 'date')
+    q = request.args.get('q', '').strip()
+    near_lat = models.parse_coordinate(request.args.get('lat'))
+    near_lon = models.parse_coordinate(request.args.get('lon'))
+    if near_lat is not None and near_lon is not None:
+        # "Near me": geotagged items within the radius matching the search and filters, nearest first
+        radius = min(models.parse_coordinate(request.args.get('radius')) or models.NEAR_ME_RADIUS_M,
+                     models.NEAR_ME_MAX_RADIUS_M)
+        items = models.get_lost_found_items_near(near_lat, near_lon, radius, filters, text=q)
+        page = {'items': items, 'next_cursor': None, 'prev_cursor': None}
+    elif q:
+        # Full-text search, ranked by relevance
+        page = models.search_lost_found_items(q, filters,
+                                              after=request.args.get('after'),
+                                              before=request.args.get('before'))
+    else:
+        page = models.get_lost_found_page(order, filters,
+                                          after=request.args.get('after'),
+                                          before=request.args.get('before'))
+    # Finder/claimer usernames come back with the items themselves
+    items = page['items']
     
     # Calculate statistics
-    total_items = len(items)
-    total_lost = sum(1 for i in items if i['status'] == 'lost')
-    total_found = sum(1 for i in items if i['status'] == 'found')
-    recent_items = items_prior[:10]
+    stats = models.get_item_stats('lost_found')
+    total_items = stats['total']
+    total_lost = stats['by_status'].get('lost', 0)
+    total_found = stats['by_status'].get('found', 0)
+    recent_items = models.get_lost_found_page('priority', limit=10)['items']
     
     # Get categories for filtering
     categories = models.get_categories('lost_found')
+    # Current filters, carried over into the pagination links
+    query_args = {k: v for k, v in request.args.items() if v and k not in ('after', 'before')}
     
     return render_template('lost_and_found/dashboard.html', 
                            user=models.get_user_by_id(current_user.id),
                            items=items,
+                           page=page,
+                           query_args=query_args,
                            total_items=total_items, 
                            total_lost=total_lost,
                            total_found=total_found, 
@@ -50,22 +73,23 @@ def dashboard():
 
 @lost_and_found_bp.route('/item/<int:item_id>')
 @login_required
+# Matches and similar photos change with other items, so the whole table's version counts
+@conditional(lambda item_id: (models.get_item_version('lost_found', item_id),
+                              models.get_data_versions('lost_found_item', 'lost_found_match')))
 def item_detail(item_id):
-    # Fetch item and current user info
+    # Fetch item (with finder/claimer usernames) and current user info
     item = models.get_lost_found_item(item_id)
-    feedback = models.get_feedback_for_item('lost_found', item_id)
-    user = models.get_user_by_id(current_user.id)
-    # Track who found or claimed
-    found_by_user = None
-    claimed_by_user = None
-    if item.get('found_by'):
-        found_by_user = models.get_user_by_id(item['found_by'])['username']
-    if item.get('claimed_by'):
-        claimed_by_user = models.get_user_by_id(item['claimed_by'])['username']
     if not item:
         flash('Item not found', 'danger')
         return redirect(url_for('lost_and_found.dashboard'))
-    return render_template('lost_and_found/detail.html', item=item, feedback=feedback, user=user, found_by_user=found_by_user, claimed_by_user=claimed_by_user)
+    feedback = models.get_feedback_for_item('lost_found', item_id)
+    user = models.get_user_by_id(current_user.id)
+    # Open reports of the opposite status that match this one's text, or whose photo looks like it
+    matches = models.get_lost_found_matches(item_id)
+    similar_items = image_match.get_similar_items(item)
+    return render_template('lost_and_found/detail.html', item=item, feedback=feedback, user=user,
+                           found_by_user=item['found_by_user'], claimed_by_user=item['claimed_by_user'],
+                           matches=matches, similar_items=similar_items)
 
 @lost_and_found_bp.route('/new', methods=['GET', 'POST'])
 @login_required
@@ -87,27 +111,14 @@ def report():
         
         # Process image upload
         if file and allowed_file(file.filename):
-            fn = secure_filename(file.filename)
-            dest_folder = UPLOAD_FOLDER
-            os.makedirs(dest_folder, exist_ok=True)
-            
-            # Resize and optimize image
-            img = Image.open(file)
-            orig_w, orig_h = img.size
-            tgt_w, tgt_h = MAX_IMAGE_SIZE
-            ratio = min(tgt_w / orig_w, tgt_h / orig_h)
-            new_w, new_h = int(orig_w * ratio), int(orig_h * ratio)
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            
-            # Create background
-            bg_color = tuple(int(c) for c in ImageStat.Stat(img).mean[:3])
-            final = Image.new('RGB', (tgt_w, tgt_h), bg_color)
-            final.paste(img, ((tgt_w - new_w) // 2, (tgt_h - new_h) // 2))
-            
-            # Save image
-            fullpath = os.path.join(dest_folder, fn)
-            final.save(fullpath, quality=QUALITY)
-            img_path = f"/images/{fn}"
+            # Reject bad or oversized images from their header before storing anything
+            rejection = images.check_upload(file)
+            if rejection:
+                flash(rejection, 'danger')
+                return redirect(url_for('lost_and_found.report'))
+            # Store the upload as-is; a background worker resizes it
+            img_path = images.image_path_for(file)
+            raw_path = image_worker.store_raw(file)
         else:
             flash('Invalid file format. Only JPG, PNG, JPEG and WEBP are allowed.', 'danger')
             return redirect(url_for('lost_and_found.report'))
@@ -120,20 +131,25 @@ def report():
             'category': form['category'],
             'status': form['status'],
             'image_path': img_path,
+            'image_status': 'processing',
             'date': form['date'],
             'location': form['location'],
             'contact_info': form['contact_info'],
-            'latitude': form.get('latitude'),
-            'longitude': form.get('longitude'),
+            'latitude': models.parse_coordinate(form.get('latitude')),
+            'longitude': models.parse_coordinate(form.get('longitude')),
             'user_id': current_user.id
         }
         
         # Save to database
         item_id = models.create_lost_found_item(item_data)
         if item_id:
+            image_worker.enqueue('lost_found', item_id, raw_path, img_path)
+            matching.match_item(item_id)
+            saved_searches.check_item('lost_found', item_id)
             flash('Report submitted successfully!', 'success')
             return redirect(url_for('lost_and_found.dashboard'))
         else:
+            image_worker.discard_raw(raw_path)
             flash('Error creating report. Please try again.', 'danger')
     
     # Get categories for the form
@@ -165,34 +181,15 @@ def edit_item(item_id):
         file = request.files.get('image_path')
         
         # Process image if provided
+        raw_path = None
         if file and file.filename and allowed_file(file.filename):
-            fn = secure_filename(file.filename)
-            dest_folder = UPLOAD_FOLDER
-            os.makedirs(dest_folder, exist_ok=True)
-            
-            # Resize and optimize image
-            img = Image.open(file)
-            orig_w, orig_h = img.size
-            tgt_w, tgt_h = MAX_IMAGE_SIZE
-            ratio = min(tgt_w / orig_w, tgt_h / orig_h)
-            new_w, new_h = int(orig_w * ratio), int(orig_h * ratio)
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            
-            # Create background
-            bg_color = tuple(int(c) for c in ImageStat.Stat(img).mean[:3])
-            final = Image.new('RGB', (tgt_w, tgt_h), bg_color)
-            final.paste(img, ((tgt_w - new_w) // 2, (tgt_h - new_h) // 2))
-            
-            # Save image
-            fullpath = os.path.join(dest_folder, fn)
-            final.save(fullpath, quality=QUALITY)
-            img_path = f"/images/{fn}"
-            
-            # Remove old image if it exists
-            if item['image_path']:
-                old_path = os.path.join(UPLOAD_FOLDER, os.path.basename(item['image_path']))
-                if os.path.exists(old_path):
-                    os.remove(old_path)
+            rejection = images.check_upload(file)
+            if rejection:
+                flash(rejection, 'danger')
+                return redirect(url_for('lost_and_found.edit_item', item_id=item_id))
+            # Store the upload as-is; the worker resizes it, then removes the old image
+            img_path = images.image_path_for(file)
+            raw_path = image_worker.store_raw(file)
         else:
             img_path = item['image_path']
         
@@ -212,11 +209,17 @@ def edit_item(item_id):
             item_data['found_by'] = None
         if form['status'] != 'claimed':
             item_data['claimed_by'] = None
+        if raw_path:
+            item_data['image_status'] = 'processing'
         # Update item
         if models.update_lost_found_item(item_id, item_data):
+            if raw_path:
+                image_worker.enqueue('lost_found', item_id, raw_path, img_path, replaced_path=item['image_path'])
+            matching.match_item(item_id)
             flash('Item updated successfully!', 'success')
             return redirect(url_for('lost_and_found.item_detail', item_id=item_id))
         else:
+            image_worker.discard_raw(raw_path)
             flash('Error updating item. Please try again.', 'danger')
     
     # Get categories for the form
@@ -240,11 +243,8 @@ def delete_item(item_id):
     
     # Delete item
     if models.delete_lost_found_item(item_id):
-        # Remove image if it exists
-        if item['image_path']:
-            path = os.path.join(UPLOAD_FOLDER, os.path.basename(item['image_path']))
-            if os.path.exists(path):
-                os.remove(path)
+        # Remove the image unless another item shares it
+        image_worker.release_image(item['image_path'])
                 
         flash('Item deleted successfully!', 'success')
     else:
@@ -1,40 +1,82 @@
 from flask import render_template, redirect, url_for, request, flash, make_response
 from flask_login import login_required, current_user
-import os
-from werkzeug.utils import secure_filename
 from datetime import datetime
-from PIL import Image, ImageStat
 import re
+import math
 
 from . import marketplace_bp
 import models  # Use local models module
-from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_IMAGE_SIZE, QUALITY, allowed_file
+import images
+import image_worker
+import saved_searches
+from conditional import conditional
+from config import ALLOWED_EXTENSIONS, allowed_file
+
+# Listing conditions, as offered by the create and edit forms
+CONDITIONS = [('new', 'New'), ('like-new', 'Like New'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor')]
+
+def _parse_price(value):
+    """Parse a price bound, returning None if it is blank, invalid or negative."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) and value >= 0 else None
 
 @marketplace_bp.route('/')
 @login_required
+@conditional(lambda: models.get_data_versions('marketplace_item', 'category'))
 def dashboard():
-    # Get all marketplace items
-    items = models.get_marketplace_items('date DESC')
+    # Search text, filters, sort order and page cursor come from the query string
+    filters = {
+        'status': request.args.get('status'),
+        'category': request.args.get('category'),
+        'condition': request.args.get('condition'),
+        'min_price': _parse_price(request.args.get('min_price')),
+        'max_price': _parse_price(request.args.get('max_price')),
+    }
+    order = request.args.get('sort')
+    q = request.args.get('q', '').strip()
+    if q:
+        # Full-text search, ranked by relevance unless a sort was picked
+        page = models.search_marketplace_items(q, filters,
+                                               after=request.args.get('after'),
+                                               before=request.args.get('before'),
+                                               order=order)
+    else:
+        page = models.get_marketplace_page(order or 'date', filters,
+                                           after=request.args.get('after'),
+                                           before=request.args.get('before'))
+    items = page['items']
     
     # Calculate statistics
-    total_items = len(items)
-    total_available = sum(1 for i in items if i['status'] == 'available')
-    total_sold = sum(1 for i in items if i['status'] == 'sold')
-    recent_items = items[:10]
+    stats = models.get_item_stats('marketplace')
+    total_items = stats['total']
+    total_available = stats['by_status'].get('available', 0)
+    total_sold = stats['by_status'].get('sold', 0)
+    recent_items = models.get_marketplace_page('date', limit=10)['items']
     
-    # Get categories for filtering
+    # Get categories for filtering, with how many listings each filter value would leave
     categories = models.get_categories('marketplace')
+    facets = models.get_marketplace_facets(filters, q)
+    # Current filters, carried over into the pagination links
+    query_args = {k: v for k, v in request.args.items() if v and k not in ('after', 'before')}
     
     return render_template('marketplace/dashboard.html', 
                            user=models.get_user_by_id(current_user.id),
                            items=items,
+                           page=page,
+                           query_args=query_args,
                            total_items=total_items, 
                            total_available=total_available,
                            total_sold=total_sold, 
                            recent_items=recent_items,
-                           categories=categories)
+                           categories=categories,
+                           conditions=CONDITIONS,
+                           facets=facets)
 
 @marketplace_bp.route('/item/<int:item_id>')
+@conditional(lambda item_id: models.get_item_version('marketplace', item_id))
 def item_detail(item_id):
     item = models.get_marketplace_item(item_id)
     if not item:
@@ -65,27 +107,14 @@ def create():
         
         # Process image upload
         if file and allowed_file(file.filename):
-            fn = secure_filename(file.filename)
-            dest_folder = UPLOAD_FOLDER
-            os.makedirs(dest_folder, exist_ok=True)
-            
-            # Resize and optimize image
-            img = Image.open(file)
-            orig_w, orig_h = img.size
-            tgt_w, tgt_h = MAX_IMAGE_SIZE
-            ratio = min(tgt_w / orig_w, tgt_h / orig_h)
-            new_w, new_h = int(orig_w * ratio), int(orig_h * ratio)
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            
-            # Create background
-            bg_color = tuple(int(c) for c in ImageStat.Stat(img).mean[:3])
-            final = Image.new('RGB', (tgt_w, tgt_h), bg_color)
-            final.paste(img, ((tgt_w - new_w) // 2, (tgt_h - new_h) // 2))
-            
-            # Save image
-            fullpath = os.path.join(dest_folder, fn)
-            final.save(fullpath, quality=QUALITY)
-            img_path = f"/images/{fn}"
+            # Reject bad or oversized images from their header before storing anything
+            rejection = images.check_upload(file)
+            if rejection:
+                flash(rejection, 'danger')
+                return redirect(url_for('marketplace.create'))
+            # Store the upload as-is; a background worker resizes it
+            img_path = images.image_path_for(file)
+            raw_path = image_worker.store_raw(file)
         else:
             flash('Invalid file format. Only JPG, PNG, JPEG and WEBP are allowed.', 'danger')
             return redirect(url_for('marketplace.create'))
@@ -98,6 +127,7 @@ def create():
             'category': form['category'],
             'condition': form['condition'],
             'image_path': img_path,
+            'image_status': 'processing',
             'location': form['location'],
             'contact_info': form['contact_info'],
             'user_id': current_user.id,
@@ -107,9 +137,12 @@ def create():
         # Save to database
         item_id = models.create_marketplace_item(item_data)
         if item_id:
+            image_worker.enqueue('marketplace', item_id, raw_path, img_path)
+            saved_searches.check_item('marketplace', item_id)
             flash('Item listed successfully!', 'success')
             return redirect(url_for('marketplace.dashboard'))
         else:
+            image_worker.discard_raw(raw_path)
             flash('Error creating listing. Please try again.', 'danger')
     
     # Get categories for the form
@@ -136,34 +169,15 @@ def edit_item(item_id):
         file = request.files.get('image_path')
         
         # Process image if provided
+        raw_path = None
         if file and file.filename and allowed_file(file.filename):
-            fn = secure_filename(file.filename)
-            dest_folder = UPLOAD_FOLDER
-            os.makedirs(dest_folder, exist_ok=True)
-            
-            # Resize and optimize image
-            img = Image.open(file)
-            orig_w, orig_h = img.size
-            tgt_w, tgt_h = MAX_IMAGE_SIZE
-            ratio = min(tgt_w / orig_w, tgt_h / orig_h)
-            new_w, new_h = int(orig_w * ratio), int(orig_h * ratio)
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            
-            # Create background
-            bg_color = tuple(int(c) for c in ImageStat.Stat(img).mean[:3])
-            final = Image.new('RGB', (tgt_w, tgt_h), bg_color)
-            final.paste(img, ((tgt_w - new_w) // 2, (tgt_h - new_h) // 2))
-            
-            # Save image
-            fullpath = os.path.join(dest_folder, fn)
-            final.save(fullpath, quality=QUALITY)
-            img_path = f"/images/{fn}"
-            
-            # Remove old image if it exists
-            if item['image_path']:
-                old_path = os.path.join(UPLOAD_FOLDER, os.path.basename(item['image_path']))
-                if os.path.exists(old_path):
-                    os.remove(old_path)
+            rejection = images.check_upload(file)
+            if rejection:
+                flash(rejection, 'danger')
+                return redirect(url_for('marketplace.edit_item', item_id=item_id))
+            # Store the upload as-is; the worker resizes it, then removes the old image
+            img_path = images.image_path_for(file)
+            raw_path = image_worker.store_raw(file)
         else:
             img_path = item['image_path']
         
@@ -180,11 +194,16 @@ def edit_item(item_id):
             'status': form['status']
         }
         
+        if raw_path:
+            item_data['image_status'] = 'processing'
         # Update item
         if models.update_marketplace_item(item_id, item_data):
+            if raw_path:
+                image_worker.enqueue('marketplace', item_id, raw_path, img_path, replaced_path=item['image_path'])
             flash('Item updated successfully!', 'success')
             return redirect(url_for('marketplace.item_detail', item_id=item_id))
         else:
+            image_worker.discard_raw(raw_path)
             flash('Error updating item. Please try again.', 'danger')
     
     # Get categories for the form
@@ -208,11 +227,8 @@ def delete_item(item_id):
     
     # Delete item
     if models.delete_marketplace_item(item_id):
-        # Remove image if it exists
-        if item['image_path']:
-            path = os.path.join(UPLOAD_FOLDER, os.path.basename(item['image_path']))
-            if os.path.exists(path):
-                os.remove(path)
+        # Remove the image unless another item shares it
+        image_worker.release_image(item['image_path'])
                 
         flash('Item deleted successfully!', 'success')
     else:
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+media_bp = Blueprint('media', __name__, url_prefix='/media')
+
+# Import routes to register them with the blueprint
+from . import routes
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""Serving of uploaded item images.
+
+Content-addressed images (see ``images``) never change, so their responses
+carry a strong ETag derived from the file name and are cacheable for a year
+with ``immutable``; browsers stop revalidating them on every dashboard view.
+Older images stored under their upload's file name can be overwritten, so
+they are served with ``no-cache`` and revalidated against their ETag.
+
+Range and conditional requests are handled by ``send_from_directory``.  Set
+USE_X_SENDFILE to let the front-end server stream the file from its
+``X-Sendfile`` header, or IMAGE_ACCEL_REDIRECT_PREFIX to an nginx ``internal``
+location aliased to UPLOAD_FOLDER to hand off with ``X-Accel-Redirect``.
+"""
+import mimetypes
+import os
+import re
+
+from flask import abort, make_response, request, send_from_directory
+from werkzeug.security import safe_join
+
+from . import media_bp
+from config import UPLOAD_FOLDER
+
+# ab/cd/<sha256><suffix>, where the suffix names the derivative and format
+HASHED_PATH = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.[a-z0-9.]+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+ACCEL_REDIRECT_PREFIX = os.environ.get('IMAGE_ACCEL_REDIRECT_PREFIX')
+
+
+@media_bp.route('/images/<path:filename>')
+def image(filename):
+    """Serve an uploaded image with validators and caching suited to its path."""
+    hashed = HASHED_PATH.match(filename) is not None
+    # A hashed name identifies the exact bytes, so it makes a strong ETag
+    etag = os.path.basename(filename) if hashed else True
+    max_age = IMMUTABLE_MAX_AGE if hashed else None
+    if ACCEL_REDIRECT_PREFIX:
+        response = _accel_redirect(filename, etag, max_age)
+    else:
+        response = send_from_directory(UPLOAD_FOLDER, filename, etag=etag, max_age=max_age, conditional=True)
+    if hashed:
+        response.cache_control.immutable = True
+    return response
+
+
+def _accel_redirect(filename, etag, max_age):
+    """Answer validation here and let nginx send the bytes, ranges included."""
+    path = safe_join(UPLOAD_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = make_response('')
+    response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    stat = os.stat(path)
+    response.last_modified = stat.st_mtime
+    response.set_etag(etag if isinstance(etag, str) else f'{stat.st_mtime}-{stat.st_size}')
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    response = response.make_conditional(request)
+    if response.status_code != 304:
+        response.headers['X-Accel-Redirect'] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{filename}"
+    return response
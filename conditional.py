@@ -0,0 +1,75 @@
+"""Conditional GET for pages rendered from the database.
+
+``conditional(page_version)`` wraps a view.  ``page_version(**view_args)``
+returns the change counters the page is built from (table and item
+versions from ``models.get_data_versions`` and ``models.get_item_version``),
+a couple of primary-key lookups that never touch the item tables.  Those
+counters, the viewer and their unread notification count, the query string
+and a stamp of the code and templates make up the page's ETag.  A request
+whose If-None-Match carries it gets a 304 before the view runs any of its
+listing queries or renders a template.
+
+Pages with flashed messages waiting are always rendered, since rendering
+them is what shows and clears the messages.
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from flask_login import current_user
+
+import models
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# Where the app's own code and templates live; a virtualenv or anything else
+# under ROOT is left out, so installing packages does not change every ETag
+STAMPED_DIRS = ('blueprints', 'templates')
+
+
+def _code_stamp():
+    """Latest modification time of the app's code and templates, so a deploy changes every ETag."""
+    paths = [os.path.join(ROOT, name) for name in os.listdir(ROOT) if name.endswith('.py')]
+    for top in STAMPED_DIRS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(ROOT, top)):
+            dirnames[:] = [d for d in dirnames if d != '__pycache__']
+            paths += [os.path.join(dirpath, name) for name in filenames if name.endswith(('.py', '.html'))]
+    return str(max(map(os.path.getmtime, paths), default=0.0))
+
+
+CODE_STAMP = _code_stamp()
+
+
+def page_etag(versions):
+    """ETag for the current request's page given the data ``versions`` it shows."""
+    if current_user.is_authenticated:
+        viewer = (current_user.id, models.count_unread_notifications(current_user.id))
+    else:
+        viewer = None
+    key = repr((CODE_STAMP, request.path, sorted(request.args.items(multi=True)), viewer, versions))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(page_version):
+    """Answer GETs of the wrapped view with 304 while ``page_version(**view_args)`` is unchanged."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+            etag = page_etag(page_version(**kwargs))
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # Rendered pages are equivalent, not byte-identical, hence weak
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
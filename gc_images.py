@@ -0,0 +1,149 @@
+"""Remove image files that no item references any more.
+
+Streams a listing of UPLOAD_FOLDER (and, with --raw, RAW_UPLOAD_FOLDER) and
+set-diffs it against the image paths still used by items and unfinished
+image jobs, including every derivative of those images.  The work is linear
+in the number of files and rows: the referenced paths are loaded into a set
+once and the directory tree is walked with os.scandir without building a
+full listing.
+
+Unreferenced files are deleted (or moved under --quarantine) in batches of
+--batch-size.  Files modified in the last --min-age seconds are left alone
+so uploads being processed right now are never touched.  Nothing is changed
+with --dry-run, which only reports what would be removed.
+
+    python gc_images.py --dry-run
+    python gc_images.py --quarantine /var/tmp/image-quarantine
+"""
+import argparse
+import os
+import shutil
+import time
+
+import images
+import image_worker
+import models
+from config import UPLOAD_FOLDER
+
+
+def referenced_files():
+    """Absolute paths of every stored file an item or unfinished job still needs."""
+    keep = set()
+    for image_path in models.iter_referenced_image_paths():
+        paths = [image_path] + [p for sizes in images.derivative_paths(image_path).values() for p in sizes.values()]
+        for path in paths:
+            try:
+                keep.add(os.path.normpath(images.upload_file(path)))
+            except ValueError:
+                # Not a path under UPLOAD_FOLDER; nothing on disk to protect
+                pass
+    return keep
+
+
+def scan_files(root):
+    """Yield a DirEntry for each file below ``root``, depth first, without listing it all at once."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def find_orphans(root, keep, min_age):
+    """Yield (path, size) of files under ``root`` that are not in ``keep`` and older than ``min_age``."""
+    cutoff = time.time() - min_age
+    for entry in scan_files(root):
+        path = os.path.normpath(entry.path)
+        if path in keep:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > cutoff:
+            continue
+        yield path, stat.st_size
+
+
+def remove_batch(batch, root, quarantine):
+    """Delete or quarantine a batch of files; return how many were removed."""
+    removed = 0
+    for path in batch:
+        try:
+            if quarantine:
+                dest = os.path.join(quarantine, os.path.relpath(path, root))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.move(path, dest)
+            else:
+                os.remove(path)
+            removed += 1
+        except OSError as e:
+            print(f"Error removing {path}: {e}")
+            continue
+        # Drop shard directories left empty
+        parent = os.path.dirname(path)
+        while os.path.abspath(parent) != os.path.abspath(root):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+    return removed
+
+
+def collect(root, keep, args):
+    """Remove the orphans under ``root`` batch by batch and print a summary."""
+    found = removed = total_bytes = 0
+    batch = []
+    for path, size in find_orphans(root, keep, args.min_age):
+        found += 1
+        total_bytes += size
+        if args.dry_run:
+            if args.verbose:
+                print(f"Would remove {path} ({size} bytes)")
+            continue
+        batch.append(path)
+        if len(batch) >= args.batch_size:
+            removed += remove_batch(batch, root, args.quarantine)
+            print(f"Removed {removed} files so far...")
+            batch = []
+    if batch:
+        removed += remove_batch(batch, root, args.quarantine)
+
+    action = 'quarantined' if args.quarantine else 'removed'
+    if args.dry_run:
+        print(f"{root}: {found} unreferenced files ({total_bytes / 1024 / 1024:.1f} MB) would be {action}")
+    else:
+        print(f"{root}: {removed} of {found} unreferenced files ({total_bytes / 1024 / 1024:.1f} MB) {action}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    parser.add_argument('--verbose', action='store_true', help='list every unreferenced file in a dry run')
+    parser.add_argument('--quarantine', metavar='DIR', help='move unreferenced files here instead of deleting them')
+    parser.add_argument('--batch-size', type=int, default=500, help='files removed per batch (default 500)')
+    parser.add_argument('--min-age', type=int, default=3600,
+                        help='skip files modified in the last this many seconds (default 3600)')
+    parser.add_argument('--raw', action='store_true', help='also clean raw uploads no unfinished job needs')
+    args = parser.parse_args()
+
+    upload_root = os.path.abspath(UPLOAD_FOLDER)
+    if args.quarantine and os.path.commonpath([upload_root, os.path.abspath(args.quarantine)]) == upload_root:
+        parser.error('--quarantine must be outside the upload folder')
+
+    keep = referenced_files()
+    print(f"{len(keep)} referenced image files")
+    collect(UPLOAD_FOLDER, keep, args)
+    if args.raw:
+        raw_keep = {os.path.normpath(path) for path in models.get_unfinished_raw_paths()}
+        collect(image_worker.RAW_UPLOAD_FOLDER, raw_keep, args)
+    models.close_db_connection()
+
+
+if __name__ == "__main__":
+    main()
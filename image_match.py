@@ -0,0 +1,70 @@
+"""Visual matching of lost and found reports by perceptual hash.
+
+Every processed upload stores the dHash of its photo (``images.dhash``) on the
+item.  ``find_similar`` compares an open lost (or found) report's hash with
+the hashes of all open reports of the opposite status and returns those
+within IMAGE_MATCH_MAX_DISTANCE differing bits, closest first.
+
+The hashes are held in memory as one NumPy array per status, so a search is
+a single vectorised XOR and popcount: well under a millisecond for 100k
+items.  The arrays are rebuilt when the 'lost_found_image_hash' data version
+(bumped by triggers whenever an item's status, image or hash changes) moves
+on from the one they were loaded at.
+"""
+import os
+import threading
+
+import numpy as np
+
+import models
+
+IMAGE_MATCH_MAX_DISTANCE = int(os.environ.get('IMAGE_MATCH_MAX_DISTANCE', 10))
+IMAGE_MATCH_LIMIT = 6
+
+_index = {'version': None, 'by_status': {}}
+_index_lock = threading.Lock()
+
+
+def _load_index():
+    """Return ``{status: (ids, hashes)}``, reloading it if the hashes changed."""
+    version = models.get_data_version('lost_found_image_hash')
+    if version == _index['version']:
+        return _index['by_status']
+    with _index_lock:
+        if version != _index['version']:
+            rows = models.get_open_image_hashes()
+            by_status = {}
+            for status in models.OPPOSITE_STATUS:
+                selected = [row for row in rows if row['status'] == status]
+                ids = np.fromiter((row['id'] for row in selected), dtype=np.int64, count=len(selected))
+                hashes = np.fromiter((row['image_hash'] for row in selected), dtype=np.int64,
+                                     count=len(selected)).view(np.uint64)
+                by_status[status] = (ids, hashes)
+            _index['by_status'] = by_status
+            _index['version'] = version
+    return _index['by_status']
+
+
+def find_similar(item, limit=IMAGE_MATCH_LIMIT, max_distance=IMAGE_MATCH_MAX_DISTANCE):
+    """Get ``(item_id, distance)`` of open opposite-status items whose photo looks like ``item``'s."""
+    opposite = models.OPPOSITE_STATUS.get(item['status'])
+    if opposite is None or item.get('image_status') != 'ready' or item.get('image_hash') is None:
+        return []
+    ids, hashes = _load_index().get(opposite, ((), ()))
+    if not len(ids):
+        return []
+    target = np.array([item['image_hash']], dtype=np.int64).view(np.uint64)
+    distances = np.bitwise_count(hashes ^ target)
+    matches = np.flatnonzero(distances <= max_distance)
+    matches = matches[np.argsort(distances[matches], kind='stable')][:limit]
+    return [(int(ids[i]), int(distances[i])) for i in matches]
+
+
+def get_similar_items(item, limit=IMAGE_MATCH_LIMIT):
+    """Get the items ``find_similar`` returns, each with its ``hash_distance``."""
+    matches = find_similar(item, limit)
+    items = models.get_lost_found_items_by_ids([item_id for item_id, _ in matches])
+    distances = dict(matches)
+    for match in items:
+        match['hash_distance'] = distances[match['id']]
+    return items
@@ -0,0 +1,109 @@
+"""Background processing of uploaded item photos.
+
+Upload routes call ``store_raw`` to write the untouched upload to
+RAW_UPLOAD_FOLDER, save the item with ``image_status = 'processing'`` and
+then ``enqueue`` a job.  The job is persisted in the ``image_job`` table
+before it is handed to a small thread pool, so a restart loses nothing:
+``resume`` (run at startup) re-submits pending jobs and any running job whose
+worker stopped updating it.  Until a job finishes, templates show a
+placeholder in place of the item's image.
+
+Image paths are content hashes, so a job whose image was already produced
+for another item just reuses its files.  ``release_image`` deletes an
+image's files once the last item referencing it is gone.
+"""
+import logging
+import os
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import images
+import models
+from config import DB_PATH
+
+logger = logging.getLogger('campus_hub.images')
+
+# Raw uploads wait here, outside the publicly served UPLOAD_FOLDER
+RAW_UPLOAD_FOLDER = os.environ.get(
+    'RAW_UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'raw_uploads'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+MAX_ATTEMPTS = 3
+# A running job not updated for this long is assumed to have lost its worker
+STALE_JOB_SECONDS = 600
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image-worker')
+
+
+def store_raw(file):
+    """Save an upload untouched under a unique name and return its path."""
+    os.makedirs(RAW_UPLOAD_FOLDER, exist_ok=True)
+    ext = os.path.splitext(file.filename)[1].lower()
+    raw_path = os.path.join(RAW_UPLOAD_FOLDER, uuid.uuid4().hex + ext)
+    file.save(raw_path)
+    return raw_path
+
+
+def discard_raw(raw_path):
+    """Remove a raw upload that will not be processed."""
+    if raw_path and os.path.exists(raw_path):
+        os.remove(raw_path)
+
+
+def enqueue(item_type, item_id, raw_path, image_path, replaced_path=None):
+    """Persist a processing job for an item and submit it to the pool."""
+    job_id = models.create_image_job(item_type, item_id, raw_path, image_path, replaced_path)
+    _executor.submit(_run, job_id)
+    return job_id
+
+
+def _run(job_id):
+    job = models.claim_image_job(job_id)
+    if job is None:
+        return
+    try:
+        processed = models.get_processed_image(job['image_path'])
+        if processed and images.is_stored(job['image_path']):
+            variants, image_hash = processed['variants'], processed['image_hash']
+        else:
+            variants, image_hash = images.process_upload(job['raw_path'], job['image_path'])
+    except Exception as e:
+        retry = job['attempts'] < MAX_ATTEMPTS and os.path.exists(job['raw_path'])
+        logger.warning('Image job %s failed (attempt %s): %s', job_id, job['attempts'], e)
+        models.fail_image_job(job, str(e), retry)
+        if retry:
+            _executor.submit(_run, job_id)
+        else:
+            discard_raw(job['raw_path'])
+        return
+
+    models.complete_image_job(job, variants, image_hash)
+    discard_raw(job['raw_path'])
+    if job['replaced_path'] and job['replaced_path'] != job['image_path']:
+        release_image(job['replaced_path'])
+
+
+def release_image(image_path):
+    """Delete a stored image and its derivatives unless an item still uses it."""
+    if image_path and not models.image_in_use(image_path):
+        images.delete_image(image_path)
+
+
+def resume():
+    """Re-submit jobs left pending or abandoned by a previous run."""
+    try:
+        job_ids = models.get_resumable_image_jobs(STALE_JOB_SECONDS)
+    except sqlite3.OperationalError:
+        # Schema not migrated yet; init_db() runs before the next resume
+        return 0
+    for job_id in job_ids:
+        _executor.submit(_run, job_id)
+    if job_ids:
+        logger.info('Resumed %d image jobs', len(job_ids))
+    return len(job_ids)
+
+
+def init_app(app):
+    """Resume outstanding image jobs when the app starts."""
+    with app.app_context():
+        resume()
@@ -0,0 +1,300 @@
+"""Image processing for uploaded item photos.
+
+Every upload is fitted inside MAX_IMAGE_SIZE, centred on a canvas of exactly
+that size filled with the photo's average colour, and saved with QUALITY.
+Phone photos are far larger than the target, so the pipeline avoids ever
+holding a full-resolution decode:
+
+* JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or
+  1/8 while decoding, to the smallest scale still at least the output size;
+* the remaining downscale uses ``reducing_gap`` so most of it is a cheap
+  box reduction before the final LANCZOS resample;
+* the background colour is averaged from a tiny thumbnail rather than from
+  every pixel.
+
+Besides the full-size image at ``image_path``, ``process_upload`` writes
+smaller derivatives next to it (a CARD_IMAGE_WIDTH wide card thumbnail as
+JPEG, and WebP copies of both sizes unless IMAGE_WEBP is off) and returns
+them so the item can record which exist.  Templates use ``image_srcset`` to
+let browsers pick the smallest file that fills the slot.
+
+Images are content-addressed: an upload's image_path is the SHA-256 of its
+bytes, sharded two levels deep (``/images/ab/cd/abcd....jpg``).  Identical
+uploads share one set of files, which are only deleted once no item
+references them (see ``image_ref`` in models), and the file behind a given
+URL never changes.
+
+``check_upload`` guards ingest: it parses only an upload's header to confirm
+the real format matches the extension and that the pixel count is within
+MAX_UPLOAD_PIXELS, so oversized images and decompression bombs are refused
+before any pixel data is decoded.  Pillow's own MAX_IMAGE_PIXELS check is
+set to the same limit, and its warning turned into an error, for the
+worker's decode.
+"""
+import hashlib
+import json
+import os
+import uuid
+import warnings
+
+from flask import url_for
+from PIL import Image, ImageStat, UnidentifiedImageError
+
+import instrumentation
+
+from config import UPLOAD_FOLDER, MAX_IMAGE_SIZE, QUALITY
+
+# Resize from at least this multiple of the output size with LANCZOS; the
+# rest of the reduction is done by averaging whole pixel blocks
+REDUCING_GAP = 3.0
+# Edge length of the thumbnail the background colour is averaged from
+BACKGROUND_SAMPLE_SIZE = 16
+# Static file shown while an upload is still being processed
+PLACEHOLDER_IMAGE = 'placeholder-processing.svg'
+# Width of the thumbnail shown on dashboard cards
+CARD_IMAGE_WIDTH = int(os.environ.get('CARD_IMAGE_WIDTH', 400))
+# Also write WebP copies of every size
+IMAGE_WEBP = os.environ.get('IMAGE_WEBP', '1') == '1'
+WEBP_METHOD = 4
+# URL prefix of image_paths; the rest of the path is relative to UPLOAD_FOLDER
+IMAGE_PATH_PREFIX = '/images/'
+HASH_CHUNK_SIZE = 1 << 16
+# Side of the greyscale grid the perceptual hash compares (HASH_SIZE ** 2 bits)
+HASH_SIZE = 8
+# Largest upload accepted, in pixels (width * height)
+MAX_UPLOAD_PIXELS = int(os.environ.get('MAX_UPLOAD_PIXELS', 50_000_000))
+Image.MAX_IMAGE_PIXELS = MAX_UPLOAD_PIXELS
+warnings.simplefilter('error', Image.DecompressionBombWarning)
+TOO_MANY_PIXELS = f'The image is too large; upload at most {MAX_UPLOAD_PIXELS // 1_000_000} megapixels.'
+# Formats Pillow may report for a file with a given extension; phone JPEGs
+# with embedded previews open as MPO
+UPLOAD_FORMATS = {'.jpg': {'JPEG', 'MPO'}, '.jpeg': {'JPEG', 'MPO'}, '.png': {'PNG'}, '.webp': {'WEBP'}}
+# Extension an upload is stored under, so the same bytes named .jpg or .jpeg
+# share one image_path (and one set of derivatives)
+STORED_EXTENSIONS = {'.jpeg': '.jpg'}
+
+
+def fit_size(size, box):
+    """Scale ``size`` to fit inside ``box``, keeping the aspect ratio."""
+    orig_w, orig_h = size
+    tgt_w, tgt_h = box
+    ratio = min(tgt_w / orig_w, tgt_h / orig_h)
+    return max(1, int(orig_w * ratio)), max(1, int(orig_h * ratio))
+
+
+def fit_image(source, size=MAX_IMAGE_SIZE):
+    """Decode the image in ``source`` scaled to fit inside ``size``, as RGB."""
+    with Image.open(source) as img:
+        new_w, new_h = fit_size(img.size, size)
+        # Only JPEG supports draft mode; other formats ignore the request
+        img.draft('RGB', (new_w, new_h))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img.resize((new_w, new_h), Image.LANCZOS, reducing_gap=REDUCING_GAP)
+
+
+def pad_image(img, size=MAX_IMAGE_SIZE):
+    """Centre ``img`` on a canvas of exactly ``size`` filled with its average colour."""
+    tgt_w, tgt_h = size
+    sample = img.resize((BACKGROUND_SAMPLE_SIZE, BACKGROUND_SAMPLE_SIZE), Image.BOX)
+    bg_color = tuple(int(c) for c in ImageStat.Stat(sample).mean[:3])
+    final = Image.new('RGB', (tgt_w, tgt_h), bg_color)
+    final.paste(img, ((tgt_w - img.width) // 2, (tgt_h - img.height) // 2))
+    return final
+
+
+def render_image(source, size=MAX_IMAGE_SIZE):
+    """Fit the image in ``source`` inside ``size`` and return it padded to exactly ``size``."""
+    return pad_image(fit_image(source, size), size)
+
+
+def dhash(img):
+    """64-bit difference hash of ``img``, as a signed integer for SQLite.
+
+    Each bit records whether a pixel of a HASH_SIZE+1 x HASH_SIZE greyscale
+    thumbnail is brighter than its right neighbour, so re-encoding, resizing
+    and small edits change few bits; the Hamming distance between two
+    hashes measures how different the photos look.
+    """
+    small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = bits << 1 | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+
+def process_image(source, dest_path, size=MAX_IMAGE_SIZE, quality=QUALITY):
+    """Fit the image in ``source`` inside ``size``, pad it to exactly ``size`` and save it."""
+    render_image(source, size).save(dest_path, quality=quality)
+    return dest_path
+
+
+def derivative_paths(image_path):
+    """Return the derivative image_paths belonging to ``image_path``, by size and format."""
+    base = os.path.splitext(image_path)[0]
+    return {'card': {'jpeg': f'{base}.card.jpg', 'webp': f'{base}.card.webp'},
+            'full': {'webp': f'{base}.webp'}}
+
+
+def process_upload(source, image_path, quality=QUALITY):
+    """Write the full-size image for ``image_path`` plus its derivatives.
+
+    Returns ``(variants, image_hash)``: the variants written, as
+    ``{format: [[width, image_path], ...]}`` with widths ascending (what the
+    item's image_variants records), and the dHash of the photo itself,
+    taken before padding so the background does not affect matching.
+    """
+    fitted = fit_image(source)
+    image_hash = dhash(fitted)
+    final = pad_image(fitted)
+    card_w = min(CARD_IMAGE_WIDTH, final.width)
+    card = final.resize((card_w, max(1, round(final.height * card_w / final.width))), Image.LANCZOS)
+    paths = derivative_paths(image_path)
+
+    _save(final, image_path, quality=quality)
+    _save(card, paths['card']['jpeg'], quality=quality)
+    variants = {'fallback': [[card.width, paths['card']['jpeg']], [final.width, image_path]]}
+    if IMAGE_WEBP:
+        _save(card, paths['card']['webp'], quality=quality, method=WEBP_METHOD)
+        _save(final, paths['full']['webp'], quality=quality, method=WEBP_METHOD)
+        variants['webp'] = [[card.width, paths['card']['webp']], [final.width, paths['full']['webp']]]
+    return variants, image_hash
+
+
+def _save(img, image_path, **params):
+    """Write ``img`` to ``image_path`` atomically, in the format its extension names.
+
+    Two jobs for the same content may run at once; writing to a temporary
+    file and renaming it means readers never see a half-written image.
+    """
+    path = upload_file(image_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fmt = Image.registered_extensions()[os.path.splitext(path)[1].lower()]
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        img.save(tmp_path, fmt, **params)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def upload_file(image_path):
+    """Filesystem path of an image_path inside UPLOAD_FOLDER."""
+    if not image_path.startswith(IMAGE_PATH_PREFIX):
+        raise ValueError(f'Not an image path: {image_path}')
+    relative = image_path[len(IMAGE_PATH_PREFIX):]
+    if not relative or '..' in relative.split('/'):
+        raise ValueError(f'Not an image path: {image_path}')
+    return os.path.join(UPLOAD_FOLDER, *relative.split('/'))
+
+
+def is_stored(image_path):
+    """Whether the full-size file for ``image_path`` exists."""
+    return os.path.exists(upload_file(image_path))
+
+
+def check_upload(file):
+    """Validate an upload from its header alone; return a rejection message or None.
+
+    Rejections are counted as ``upload_rejected.<reason>`` in instrumentation.
+    """
+    ext = os.path.splitext(file.filename)[1].lower()
+    try:
+        # Image.open only reads the header; pixel data is decoded lazily
+        with Image.open(file.stream) as img:
+            fmt, (width, height) = img.format, img.size
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        return _reject('too_many_pixels', TOO_MANY_PIXELS)
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return _reject('unreadable', 'The file is not a readable image.')
+    finally:
+        file.stream.seek(0)
+    if fmt not in UPLOAD_FORMATS.get(ext, ()):
+        return _reject('format_mismatch', f'The file is a {fmt} image, not {ext[1:].upper()} as its name says.')
+    if width * height > MAX_UPLOAD_PIXELS:
+        return _reject('too_many_pixels', TOO_MANY_PIXELS)
+    return None
+
+
+def _reject(reason, message):
+    instrumentation.count('upload_rejected', reason)
+    return message
+
+
+def image_path_for(file):
+    """Return the content-addressed image_path for an uploaded file.
+
+    The file is hashed in chunks and rewound so it can still be saved.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.stream.seek(0)
+    name = digest.hexdigest()
+    ext = os.path.splitext(file.filename)[1].lower()
+    ext = STORED_EXTENSIONS.get(ext, ext)
+    return f'{IMAGE_PATH_PREFIX}{name[:2]}/{name[2:4]}/{name}{ext}'
+
+
+def delete_image(image_path):
+    """Remove a stored image and its derivatives, if they still exist."""
+    if not image_path:
+        return
+    original = upload_file(image_path)
+    if os.path.exists(original):
+        os.remove(original)
+    # Derivatives are named after the content hash alone, so they stay while
+    # another original of the same bytes (stored before extensions were
+    # normalized, e.g. .jpeg beside .jpg) still uses them
+    base, ext = os.path.splitext(original)
+    aliases = [other for other, formats in UPLOAD_FORMATS.items()
+               if other != ext and formats == UPLOAD_FORMATS.get(ext)]
+    if not any(os.path.exists(base + other) for other in aliases):
+        for sizes in derivative_paths(image_path).values():
+            for path in sizes.values():
+                path = upload_file(path)
+                if os.path.exists(path):
+                    os.remove(path)
+    # Drop the shard directories once they are empty
+    shard = os.path.dirname(upload_file(image_path))
+    while os.path.abspath(shard) != os.path.abspath(UPLOAD_FOLDER):
+        try:
+            os.rmdir(shard)
+        except OSError:
+            break
+        shard = os.path.dirname(shard)
+
+
+def stored_url(image_path):
+    """URL the media blueprint serves a stored image_path under."""
+    return url_for('media.image', filename=image_path[len(IMAGE_PATH_PREFIX):])
+
+
+def image_url(item):
+    """URL of an item's image for templates, or None if it has none.
+
+    Items whose upload is still being processed get the placeholder image;
+    those whose processing failed are treated as having no image.
+    """
+    status = item.get('image_status', 'ready')
+    if status == 'processing':
+        return url_for('static', filename=PLACEHOLDER_IMAGE)
+    if status != 'ready' or not item.get('image_path'):
+        return None
+    return stored_url(item['image_path'])
+
+
+def image_srcset(item, fmt='fallback'):
+    """``srcset`` value listing an item's ``fmt`` variants, or '' if it has none.
+
+    Items processed before derivatives existed (or still processing) have no
+    image_variants and fall back to the single ``image_url``.
+    """
+    if item.get('image_status', 'ready') != 'ready' or not item.get('image_variants'):
+        return ''
+    variants = json.loads(item['image_variants']).get(fmt, [])
+    return ', '.join(f"{stored_url(path)} {width}w" for width, path in variants)
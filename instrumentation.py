@@ -0,0 +1,157 @@
+"""Per-request SQL instrumentation for the model layer.
+
+Connections opened by ``models`` use ``InstrumentedConnection``, whose cursors
+time every statement.  While a request is being handled the timings are
+collected on ``g``: the number of queries, the total time spent in SQLite and
+the slowest few statements.  ``init_app`` reports them at the end of the
+request:
+
+* to the ``campus_hub.sql`` logger, for a random SQL_LOG_SAMPLE_RATE fraction
+  of requests and for every request slower than SQL_SLOW_REQUEST_MS;
+* as ``X-DB-Queries`` and ``Server-Timing`` response headers when the app
+  runs in debug mode (or SQL_DEBUG_HEADERS is set).
+
+It also keeps process-wide event counters (``count``/``get_counters``), such
+as uploads rejected by the ingest guard, keyed by event and reason.  Their
+running totals are logged alongside every request whose SQL stats are.
+"""
+import heapq
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_app_context, request
+
+logger = logging.getLogger('campus_hub.sql')
+
+SQL_LOG_SAMPLE_RATE = float(os.environ.get('SQL_LOG_SAMPLE_RATE', 0.01))
+SQL_SLOW_REQUEST_MS = float(os.environ.get('SQL_SLOW_REQUEST_MS', 250))
+SLOWEST_STATEMENTS = 5
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _stats():
+    """Return the current request's query stats, or None outside a request."""
+    if not has_app_context():
+        return None
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = {'count': 0, 'seconds': 0.0, 'slowest': []}
+    return stats
+
+
+def record_query(sql, seconds):
+    """Add one statement's timing to the current request's stats."""
+    stats = _stats()
+    if stats is None:
+        return
+    stats['count'] += 1
+    stats['seconds'] += seconds
+    entry = (seconds, stats['count'], ' '.join(sql.split()))
+    if len(stats['slowest']) < SLOWEST_STATEMENTS:
+        heapq.heappush(stats['slowest'], entry)
+    else:
+        heapq.heappushpop(stats['slowest'], entry)
+
+
+def add_time(seconds):
+    """Charge time spent fetching rows to the current request."""
+    stats = _stats()
+    if stats is not None:
+        stats['seconds'] += seconds
+
+
+def count(event, reason=None):
+    """Increment a process-wide event counter, optionally split by ``reason``."""
+    key = f'{event}.{reason}' if reason else event
+    with _counters_lock:
+        _counters[key] += 1
+
+
+def get_counters():
+    """Snapshot of the event counters."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times statement execution and row fetching."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            add_time(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            add_time(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            add_time(time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the implicit ones, are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def init_app(app):
+    """Report each request's SQL stats through logging and, in debug, headers."""
+
+    @app.after_request
+    def report_sql_stats(response):
+        stats = g.get('sql_stats')
+        if not stats:
+            return response
+        total_ms = stats['seconds'] * 1000
+        if app.debug or app.config.get('SQL_DEBUG_HEADERS'):
+            response.headers['X-DB-Queries'] = str(stats['count'])
+            response.headers.add('Server-Timing', f'db;dur={total_ms:.2f};desc="{stats["count"]} queries"')
+        if total_ms >= SQL_SLOW_REQUEST_MS or random.random() < SQL_LOG_SAMPLE_RATE:
+            slowest = sorted(stats['slowest'], reverse=True)
+            logger.info(
+                '%s %s: %d queries, %.1f ms in SQLite; slowest: %s',
+                request.method, request.path, stats['count'], total_ms,
+                '; '.join(f'{seconds * 1000:.1f} ms {sql[:200]}' for seconds, _, sql in slowest),
+            )
+            counters = get_counters()
+            if counters:
+                logger.info('Event counters: %s', ', '.join(f'{key}={n}' for key, n in sorted(counters.items())))
+        return response
@@ -0,0 +1,153 @@
+"""Matching of lost reports with found reports, and found with lost.
+
+``match_item`` runs whenever a lost & found item is reported or edited.  It
+looks the item's name and description tokens up in the token index for
+opposite-status items dated within MATCH_DATE_WINDOW_DAYS, so the work per
+item depends on how many similar reports that window holds rather than on
+the size of the table.  The best MATCH_CANDIDATES by shared tokens are then
+scored on:
+
+* text: the weight of the tokens both share, relative to the geometric mean
+  of each side's total, where tokens common in the window weigh less than
+  rare ones;
+* category: whether both were filed under the same category;
+* date: how close the two dates are, relative to the window;
+* location: distance between the reported coordinates when both have them,
+  otherwise overlap of the location descriptions.
+
+The top MATCH_TOP_K scoring at least MATCH_MIN_SCORE are stored (in both
+directions) and shown on the item's detail page.  The owner of a lost report
+is notified (see ``notifications``) when a found report matches it with at
+least MATCH_NOTIFY_SCORE.
+"""
+import logging
+import math
+import os
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import models
+import notifications
+import tokens
+
+logger = logging.getLogger('campus_hub.matching')
+
+MATCH_DATE_WINDOW_DAYS = int(os.environ.get('MATCH_DATE_WINDOW_DAYS', 30))
+MATCH_MIN_SCORE = float(os.environ.get('MATCH_MIN_SCORE', 0.35))
+MATCH_NOTIFY_SCORE = float(os.environ.get('MATCH_NOTIFY_SCORE', 0.6))
+MATCH_TOP_K = 5
+# Candidates scored in full, picked by shared token weight
+MATCH_CANDIDATES = 50
+# Coordinates this far apart score 1/e on location
+MATCH_DISTANCE_SCALE_M = 500
+WEIGHTS = {'text': 0.5, 'category': 0.2, 'date': 0.15, 'location': 0.15}
+
+
+def _day(value):
+    try:
+        return date.fromisoformat((value or '')[:10])
+    except ValueError:
+        return None
+
+
+def _token_weights(query_tokens, postings):
+    """Weight each query token by how rare it is among the window's candidates."""
+    df = Counter(token for token, _ in postings)
+    return {token: 1 / (1 + math.log1p(df[token])) for token in query_tokens}
+
+
+def text_similarity(item_tokens, candidate_tokens, weights):
+    """Weighted overlap of two token lists: 1 when identical, 0 when disjoint."""
+    weight = lambda token: weights.get(token, 1.0)
+    shared = sum(weight(token) for token in set(item_tokens) & set(candidate_tokens))
+    total = math.sqrt(sum(map(weight, item_tokens)) * sum(map(weight, candidate_tokens)))
+    return shared / total if total else 0.0
+
+
+def score(item, candidate, item_tokens, weights):
+    """Score how likely ``candidate`` is the same object as ``item``, from 0 to 1.
+
+    Components with nothing to compare (no date or location on either side)
+    are left out and the remaining weights rescaled.
+    """
+    candidate_tokens = tokens.tokenize(candidate['name'], candidate.get('description'), limit=models.ITEM_TOKEN_LIMIT)
+    parts = {'text': text_similarity(item_tokens, candidate_tokens, weights),
+             'category': 1.0 if item.get('category') and item['category'] == candidate.get('category') else 0.0}
+
+    item_day, candidate_day = _day(item.get('date')), _day(candidate.get('date'))
+    if item_day and candidate_day:
+        parts['date'] = max(0.0, 1 - abs((item_day - candidate_day).days) / MATCH_DATE_WINDOW_DAYS)
+
+    if models.has_location(item) and models.has_location(candidate):
+        distance = models.haversine_m(item['latitude'], item['longitude'], candidate['latitude'], candidate['longitude'])
+        parts['location'] = math.exp(-distance / MATCH_DISTANCE_SCALE_M)
+    else:
+        here, there = set(tokens.tokenize(item.get('location'))), set(tokens.tokenize(candidate.get('location')))
+        if here and there:
+            parts['location'] = len(here & there) / len(here | there)
+
+    used = sum(WEIGHTS[name] for name in parts)
+    return sum(WEIGHTS[name] * value for name, value in parts.items()) / used
+
+
+def find_matches(item, also=()):
+    """Score opposite-status items in the date window against ``item``; return [(candidate, score)], best first.
+
+    Items in ``also`` that are candidates at all are scored even if they fall
+    outside the best MATCH_CANDIDATES.
+    """
+    opposite = models.OPPOSITE_STATUS.get(item['status'])
+    item_day = _day(item.get('date'))
+    query_tokens = tokens.tokenize(item['name'], item.get('description'), limit=models.ITEM_TOKEN_LIMIT)
+    if opposite is None or item_day is None or not query_tokens:
+        return []
+    window = timedelta(days=MATCH_DATE_WINDOW_DAYS)
+    postings = models.get_token_postings(query_tokens, opposite,
+                                         (item_day - window).isoformat(), (item_day + window).isoformat())
+    weights = _token_weights(query_tokens, postings)
+    shared = defaultdict(float)
+    for token, candidate_id in postings:
+        if candidate_id != item['id']:
+            shared[candidate_id] += weights[token]
+
+    best = sorted(shared, key=shared.get, reverse=True)[:MATCH_CANDIDATES]
+    best += [candidate_id for candidate_id in also if candidate_id in shared and candidate_id not in best]
+    scored = [(candidate, score(item, candidate, query_tokens, weights))
+              for candidate in models.get_lost_found_items_by_ids(best)]
+    return sorted(scored, key=lambda pair: pair[1], reverse=True)
+
+
+def match_item(item_id):
+    """Recompute and store the matches of one lost & found item; return them as [(match_id, score)]."""
+    try:
+        item = models.get_lost_found_item(item_id)
+        if not item:
+            return []
+        # Items already listing this one are scored again, so an edit updates their lists too
+        holders = models.get_lost_found_match_holders(item_id)
+        candidates = [(candidate, round(value, 4)) for candidate, value in find_matches(item, holders)]
+        above = [(candidate, value) for candidate, value in candidates if value >= MATCH_MIN_SCORE]
+        scored = above[:MATCH_TOP_K]
+        matches = [(candidate['id'], value) for candidate, value in scored]
+        rescored = [(candidate['id'], value) for candidate, value in above[MATCH_TOP_K:]]
+        kept = {candidate['id'] for candidate, _ in above}
+        unmatched = [holder for holder in holders if holder not in kept]
+        models.save_lost_found_matches(item_id, matches, MATCH_TOP_K, rescored, unmatched)
+    except Exception:
+        logger.exception('Matching lost & found item %s failed', item_id)
+        return []
+    notes = []
+    for candidate, value in scored:
+        lost, found = (item, candidate) if item['status'] == 'lost' else (candidate, item)
+        if value >= MATCH_NOTIFY_SCORE and lost['user_id'] != found['user_id']:
+            notes.append({
+                'user_id': lost['user_id'],
+                'kind': 'match',
+                'item_type': 'lost_found',
+                'item_id': found['id'],
+                'message': f"Someone reported finding \"{found['name']}\", which looks like your lost "
+                           f"\"{lost['name']}\".",
+            })
+    if notes:
+        notifications.notify(notes)
+    return matches
@@ -2,29 +2,126 @@ import sqlite3
 from datetime import datetime
 import os
 import hashlib
+import base64
+import json
+import math
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, has_app_context
 from flask_login import UserMixin
 from config import DB_PATH
+from instrumentation import InstrumentedConnection
+import tokens
 
 class User(UserMixin):
     def __init__(self, id):
         self.id = id
 
-def get_db_connection():
-    """Create a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
+# Connection management
+#
+# Opening a connection and re-applying the PRAGMAs on every model call is the
+# single biggest cost on the request path, so connections are pooled.  Inside
+# a Flask app context the first model call checks a connection out of the
+# pool and binds it to ``g``; ``close_db_connection`` (registered as a
+# teardown handler by ``init_app``) rolls back anything left uncommitted and
+# hands it back.  Outside an app context (scripts, background threads) each
+# thread keeps one connection of its own.
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+
+def _connect():
+    """Open a new connection and apply the per-connection PRAGMAs once."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, factory=InstrumentedConnection)
     conn.row_factory = sqlite3.Row
     # Enable foreign keys and ensure WAL journal mode for better reliability
     conn.execute('PRAGMA foreign_keys = ON')
     conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA busy_timeout = 5000')
     return conn
 
-def init_db():
-    """Initialize the database with tables and default data if they don't exist."""
+def _checkout():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+def _checkin(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def get_db_connection():
+    """Return the connection bound to the current request (or thread)."""
+    if has_app_context():
+        if 'db' not in g:
+            g.db = _checkout()
+        return g.db
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = _connect()
+    return conn
+
+def close_db_connection(exc=None):
+    """Return the request's connection to the pool (app teardown handler)."""
+    if has_app_context():
+        conn = g.pop('db', None)
+        if conn is not None:
+            _checkin(conn)
+        return
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+@contextmanager
+def transaction():
+    """Run a block of statements atomically on the current connection."""
     conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create tables
-    cur.executescript('''
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def init_app(app):
+    """Register the connection teardown handler on the Flask app."""
+    app.teardown_appcontext(close_db_connection)
+
+# Schema migrations
+#
+# The schema version is stored in PRAGMA user_version.  Each entry in
+# MIGRATIONS upgrades the database by one version inside its own transaction,
+# so starting the app against an up-to-date database costs a single PRAGMA
+# read.  Append new steps to the end of the list; never edit a released one.
+def _execute_script(cur, script):
+    """Run a multi-statement script without executescript()'s implicit COMMIT."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            cur.execute(statement)
+            statement = ''
+    if statement.strip():
+        cur.execute(statement)
+
+def _column_exists(cur, table, column):
+    cur.execute(f'PRAGMA table_info({table})')
+    return any(row['name'] == column for row in cur.fetchall())
+
+def _migration_1_base_schema(cur):
+    """Create the tables, upgrade databases made by older releases and seed defaults."""
+    _execute_script(cur, '''
         CREATE TABLE IF NOT EXISTS user (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -32,7 +129,8 @@ def init_db():
             email TEXT UNIQUE,
             role TEXT DEFAULT 'student',
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            is_admin INTEGER DEFAULT 0
+            is_admin INTEGER DEFAULT 0,
+            is_confirmed INTEGER DEFAULT 0
         );
         
         CREATE TABLE IF NOT EXISTS lost_found_item (
@@ -49,6 +147,8 @@ def init_db():
             latitude REAL,
             longitude REAL,
             user_id INTEGER NOT NULL,
+            found_by INTEGER,
+            claimed_by INTEGER,
             FOREIGN KEY (user_id) REFERENCES user (id)
         );
         
@@ -85,46 +185,35 @@ def init_db():
         );
     ''')
     
-    # Check if default users exist
-    cur.execute('SELECT COUNT(*) FROM user WHERE username IN (?, ?)', ('admin', 'temp'))
-    if cur.fetchone()[0] < 2:
-        # Add default admin and temp user if they don't exist
-        admin_pass = hashlib.sha256('admin123'.encode()).hexdigest()
-        temp_pass = hashlib.sha256('temp123'.encode()).hexdigest()
-        
-        cur.execute(
-            'INSERT OR IGNORE INTO user (username, password, email, role, is_admin) VALUES (?, ?, ?, ?, ?)',
-            ('admin', admin_pass, 'admin@campushub.com', 'admin', 1)
-        )
-        cur.execute(
-            'INSERT OR IGNORE INTO user (username, password, email, role, is_admin) VALUES (?, ?, ?, ?, ?)',
-            ('temp', temp_pass, 'temp@campushub.com', 'guest', 0)
-        )
-    
-    # Check if existing users need the role field
-    try:
-        cur.execute('SELECT role FROM user LIMIT 1')
-    except sqlite3.OperationalError:
-        # role column doesn't exist, add it
+    # Databases created before these columns existed need them added
+    if not _column_exists(cur, 'user', 'role'):
         cur.execute('ALTER TABLE user ADD COLUMN role TEXT DEFAULT "student"')
         cur.execute('UPDATE user SET role = "admin" WHERE is_admin = 1')
         cur.execute('UPDATE user SET role = "student" WHERE is_admin = 0 AND username != "temp"')
         cur.execute('UPDATE user SET role = "guest" WHERE username = "temp"')
-    
-    # Check if existing users need the created_at field
-    try:
-        cur.execute('SELECT created_at FROM user LIMIT 1')
-    except sqlite3.OperationalError:
-        # created_at column doesn't exist, add it
-        cur.execute('ALTER TABLE user ADD COLUMN created_at TEXT DEFAULT CURRENT_TIMESTAMP')
-    
-    # Check if existing users need the is_confirmed field
-    try:
-        cur.execute('SELECT is_confirmed FROM user LIMIT 1')
-    except sqlite3.OperationalError:
+    if not _column_exists(cur, 'user', 'created_at'):
+        cur.execute('ALTER TABLE user ADD COLUMN created_at TEXT')
+    if not _column_exists(cur, 'user', 'is_confirmed'):
         cur.execute('ALTER TABLE user ADD COLUMN is_confirmed INTEGER DEFAULT 0')
         cur.execute('UPDATE user SET is_confirmed = 1 WHERE is_admin = 1')
         cur.execute('UPDATE user SET is_confirmed = 1 WHERE username = "temp"')
+    # Columns for tracking finder and claimer on lost_found_item
+    if not _column_exists(cur, 'lost_found_item', 'found_by'):
+        cur.execute('ALTER TABLE lost_found_item ADD COLUMN found_by INTEGER')
+    if not _column_exists(cur, 'lost_found_item', 'claimed_by'):
+        cur.execute('ALTER TABLE lost_found_item ADD COLUMN claimed_by INTEGER')
+    
+    # Add default admin and temp user if they don't exist
+    admin_pass = hashlib.sha256('admin123'.encode()).hexdigest()
+    temp_pass = hashlib.sha256('temp123'.encode()).hexdigest()
+    cur.execute(
+        'INSERT OR IGNORE INTO user (username, password, email, role, is_admin, is_confirmed) VALUES (?, ?, ?, ?, ?, ?)',
+        ('admin', admin_pass, 'admin@campushub.com', 'admin', 1, 1)
+    )
+    cur.execute(
+        'INSERT OR IGNORE INTO user (username, password, email, role, is_admin, is_confirmed) VALUES (?, ?, ?, ?, ?, ?)',
+        ('temp', temp_pass, 'temp@campushub.com', 'guest', 0, 1)
+    )
 
     # Check if default categories exist
     cur.execute('SELECT COUNT(*) FROM category')
@@ -153,43 +242,562 @@ def init_db():
         ]
         
         # Insert all categories
-        for name, type in lost_found_categories + market_categories:
-            cur.execute('INSERT INTO category (name, type) VALUES (?, ?)', (name, type))
+        cur.executemany('INSERT INTO category (name, type) VALUES (?, ?)',
+                        lost_found_categories + market_categories)
 
-    # Add columns for tracking finder and claimer on lost_found_item
-    try:
-        cur.execute('SELECT found_by FROM lost_found_item LIMIT 1')
-    except sqlite3.OperationalError:
-        cur.execute('ALTER TABLE lost_found_item ADD COLUMN found_by INTEGER')
-    try:
-        cur.execute('SELECT claimed_by FROM lost_found_item LIMIT 1')
-    except sqlite3.OperationalError:
-        cur.execute('ALTER TABLE lost_found_item ADD COLUMN claimed_by INTEGER')
+def _migration_2_indexes(cur):
+    """Index the columns the dashboards, profile page and feedback lists filter and sort on.
+
+    Every index implicitly ends in the rowid, so an index on (status, date)
+    also serves the keyset order (date, id) within one status.
+    """
+    _execute_script(cur, '''
+        CREATE INDEX IF NOT EXISTS idx_lost_found_item_date ON lost_found_item (date);
+        CREATE INDEX IF NOT EXISTS idx_lost_found_item_priority ON lost_found_item (priority);
+        CREATE INDEX IF NOT EXISTS idx_lost_found_item_status_date ON lost_found_item (status, date);
+        CREATE INDEX IF NOT EXISTS idx_lost_found_item_status_priority ON lost_found_item (status, priority);
+        CREATE INDEX IF NOT EXISTS idx_lost_found_item_category_date ON lost_found_item (category, date);
+        CREATE INDEX IF NOT EXISTS idx_lost_found_item_user_date ON lost_found_item (user_id, date);
+
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_date ON marketplace_item (date);
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_status_date ON marketplace_item (status, date);
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_category_date ON marketplace_item (category, date);
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_user_date ON marketplace_item (user_id, date);
+
+        CREATE INDEX IF NOT EXISTS idx_feedback_item ON feedback (item_type, item_id, date);
+        CREATE INDEX IF NOT EXISTS idx_category_type ON category (type);
+    ''')
+
+def _migration_3_item_stats(cur):
+    """Keep per-status and per-category item counts in a trigger-maintained table.
+
+    Dashboards read their statistics from item_stats instead of counting the
+    item tables, so the cost no longer grows with the number of listings.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS item_stats (
+            item_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (item_type, status, category)
+        ) WITHOUT ROWID
+    ''')
+    for item_type, table in (('lost_found', 'lost_found_item'), ('marketplace', 'marketplace_item')):
+        _execute_script(cur, f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO item_stats (item_type, status, category, total)
+                VALUES ('{item_type}', NEW.status, COALESCE(NEW.category, ''), 1)
+                ON CONFLICT (item_type, status, category) DO UPDATE SET total = total + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE item_stats SET total = total - 1
+                WHERE item_type = '{item_type}' AND status = OLD.status
+                  AND category = COALESCE(OLD.category, '');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE OF status, category ON {table}
+            WHEN OLD.status IS NOT NEW.status OR OLD.category IS NOT NEW.category
+            BEGIN
+                UPDATE item_stats SET total = total - 1
+                WHERE item_type = '{item_type}' AND status = OLD.status
+                  AND category = COALESCE(OLD.category, '');
+                INSERT INTO item_stats (item_type, status, category, total)
+                VALUES ('{item_type}', NEW.status, COALESCE(NEW.category, ''), 1)
+                ON CONFLICT (item_type, status, category) DO UPDATE SET total = total + 1;
+            END;
+        ''')
+        cur.execute(f'''
+            INSERT INTO item_stats (item_type, status, category, total)
+            SELECT '{item_type}', status, COALESCE(category, ''), COUNT(*)
+            FROM {table} GROUP BY status, COALESCE(category, '')
+        ''')
+
+def _migration_4_full_text_search(cur):
+    """Mirror the searchable item columns into external-content FTS5 tables."""
+    for table, fts in (('lost_found_item', 'lost_found_fts'), ('marketplace_item', 'marketplace_fts')):
+        _execute_script(cur, f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                name, description, location, category,
+                content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts} (rowid, name, description, location, category)
+                VALUES (NEW.id, NEW.name, NEW.description, NEW.location, NEW.category);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, name, description, location, category)
+                VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.location, OLD.category);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {fts}_update
+            AFTER UPDATE OF name, description, location, category ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, name, description, location, category)
+                VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.location, OLD.category);
+                INSERT INTO {fts} (rowid, name, description, location, category)
+                VALUES (NEW.id, NEW.name, NEW.description, NEW.location, NEW.category);
+            END;
+        ''')
+        cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def _migration_5_geo_index(cur):
+    """Index lost & found coordinates in an R*Tree for "near me" queries.
+
+    Each geotagged item is stored as a zero-size box.  Rows whose latitude or
+    longitude is missing (or was stored as an empty form value) are skipped.
+    """
+    _execute_script(cur, '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS lost_found_geo USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        );
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_geo_insert AFTER INSERT ON lost_found_item
+        WHEN typeof(NEW.latitude) IN ('integer', 'real') AND typeof(NEW.longitude) IN ('integer', 'real')
+        BEGIN
+            INSERT INTO lost_found_geo VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_geo_delete AFTER DELETE ON lost_found_item
+        BEGIN
+            DELETE FROM lost_found_geo WHERE id = OLD.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_geo_update AFTER UPDATE OF latitude, longitude ON lost_found_item
+        BEGIN
+            DELETE FROM lost_found_geo WHERE id = OLD.id;
+            INSERT INTO lost_found_geo
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE typeof(NEW.latitude) IN ('integer', 'real') AND typeof(NEW.longitude) IN ('integer', 'real');
+        END;
+
+        INSERT INTO lost_found_geo
+        SELECT id, latitude, latitude, longitude, longitude FROM lost_found_item
+        WHERE typeof(latitude) IN ('integer', 'real') AND typeof(longitude) IN ('integer', 'real');
+    ''')
+
+def _migration_6_data_versions(cur):
+    """Add the data_version table of change counters and bump 'category' on every change.
+
+    In-process caches (the category registry, for one) compare a counter
+    with the one they loaded, so a change made by any worker reaches all of
+    them without the cached data being queried again.
+    """
+    _execute_script(cur, '''
+        CREATE TABLE IF NOT EXISTS data_version (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+
+        INSERT OR IGNORE INTO data_version (name, version) VALUES ('category', 1);
+    ''')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS category_version_{event.lower()} AFTER {event} ON category
+            BEGIN
+                UPDATE data_version SET version = version + 1 WHERE name = 'category';
+            END
+        ''')
+
+def _migration_7_image_jobs(cur):
+    """Track each item's image processing state and persist the background job queue."""
+    for table in ('lost_found_item', 'marketplace_item'):
+        if not _column_exists(cur, table, 'image_status'):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN image_status TEXT NOT NULL DEFAULT 'ready'")
+    _execute_script(cur, '''
+        CREATE TABLE IF NOT EXISTS image_job (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_type TEXT NOT NULL CHECK(item_type IN ('lost_found', 'marketplace')),
+            item_id INTEGER NOT NULL,
+            raw_path TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            replaced_path TEXT,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_image_job_status ON image_job (status, updated_at);
+    ''')
+
+def _migration_8_image_variants(cur):
+    """Record the resized derivatives written for each item's image."""
+    for table in ('lost_found_item', 'marketplace_item'):
+        if not _column_exists(cur, table, 'image_variants'):
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN image_variants TEXT')
+
+def _migration_9_image_refs(cur):
+    """Count the items referencing each stored image so shared files are only removed when unused."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS image_ref (
+            image_path TEXT PRIMARY KEY,
+            refcount INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for table in ('lost_found_item', 'marketplace_item'):
+        _execute_script(cur, f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_image_path ON {table} (image_path);
+
+            CREATE TRIGGER IF NOT EXISTS {table}_image_ref_insert AFTER INSERT ON {table}
+            WHEN NEW.image_path IS NOT NULL
+            BEGIN
+                INSERT INTO image_ref (image_path, refcount) VALUES (NEW.image_path, 1)
+                ON CONFLICT (image_path) DO UPDATE SET refcount = refcount + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_image_ref_delete AFTER DELETE ON {table}
+            WHEN OLD.image_path IS NOT NULL
+            BEGIN
+                UPDATE image_ref SET refcount = refcount - 1 WHERE image_path = OLD.image_path;
+                DELETE FROM image_ref WHERE image_path = OLD.image_path AND refcount <= 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_image_ref_update AFTER UPDATE OF image_path ON {table}
+            WHEN OLD.image_path IS NOT NEW.image_path
+            BEGIN
+                UPDATE image_ref SET refcount = refcount - 1 WHERE image_path = OLD.image_path;
+                DELETE FROM image_ref WHERE image_path = OLD.image_path AND refcount <= 0;
+                INSERT INTO image_ref (image_path, refcount)
+                SELECT NEW.image_path, 1 WHERE NEW.image_path IS NOT NULL
+                ON CONFLICT (image_path) DO UPDATE SET refcount = refcount + 1;
+            END;
+        ''')
+    cur.execute('''
+        INSERT OR REPLACE INTO image_ref (image_path, refcount)
+        SELECT image_path, COUNT(*) FROM (
+            SELECT image_path FROM lost_found_item WHERE image_path IS NOT NULL
+            UNION ALL
+            SELECT image_path FROM marketplace_item WHERE image_path IS NOT NULL
+        ) GROUP BY image_path
+    ''')
+
+def _migration_10_image_hashes(cur):
+    """Store a perceptual hash per item image and count changes to the open lost & found hashes."""
+    for table in ('lost_found_item', 'marketplace_item'):
+        if not _column_exists(cur, table, 'image_hash'):
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN image_hash INTEGER')
+    _execute_script(cur, '''
+        INSERT OR IGNORE INTO data_version (name, version) VALUES ('lost_found_image_hash', 1);
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_image_hash_insert AFTER INSERT ON lost_found_item
+        WHEN NEW.image_hash IS NOT NULL
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE name = 'lost_found_image_hash';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_image_hash_delete AFTER DELETE ON lost_found_item
+        WHEN OLD.image_hash IS NOT NULL
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE name = 'lost_found_image_hash';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_image_hash_update
+        AFTER UPDATE OF status, image_status, image_hash ON lost_found_item
+        WHEN OLD.status IS NOT NEW.status OR OLD.image_status IS NOT NEW.image_status
+          OR OLD.image_hash IS NOT NEW.image_hash
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE name = 'lost_found_image_hash';
+        END;
+    ''')
+
+def _migration_11_match_index(cur):
+    """Index lost & found text by token, status and day for matching, and store each item's best matches."""
+    _execute_script(cur, '''
+        CREATE TABLE IF NOT EXISTS lost_found_token (
+            token TEXT NOT NULL,
+            status TEXT NOT NULL,
+            day TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            PRIMARY KEY (token, status, day, item_id)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_lost_found_token_item ON lost_found_token (item_id);
+
+        CREATE TABLE IF NOT EXISTS lost_found_match (
+            item_id INTEGER NOT NULL,
+            match_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (item_id, match_id)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_lost_found_match_match ON lost_found_match (match_id);
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_token_delete AFTER DELETE ON lost_found_item
+        BEGIN
+            DELETE FROM lost_found_token WHERE item_id = OLD.id;
+            DELETE FROM lost_found_match WHERE item_id = OLD.id OR match_id = OLD.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS lost_found_token_update AFTER UPDATE OF status, date ON lost_found_item
+        WHEN OLD.status IS NOT NEW.status OR OLD.date IS NOT NEW.date
+        BEGIN
+            UPDATE lost_found_token SET status = NEW.status, day = substr(NEW.date, 1, 10)
+            WHERE item_id = NEW.id;
+        END;
+    ''')
+    cur.execute('SELECT id, name, description, status, date FROM lost_found_item')
+    for item_id, name, description, status, date in cur.fetchall():
+        _index_lost_found_tokens(cur, item_id, name, description, status, date)
+
+def _migration_12_saved_searches(cur):
+    """Add saved searches, the index of their predicates and the notification queue."""
+    _execute_script(cur, '''
+        CREATE TABLE IF NOT EXISTS saved_search (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL CHECK(item_type IN ('lost_found', 'marketplace')),
+            query TEXT,
+            category TEXT,
+            status TEXT,
+            latitude REAL,
+            longitude REAL,
+            radius_m REAL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user (id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_saved_search_user ON saved_search (user_id);
+
+        CREATE TABLE IF NOT EXISTS saved_search_key (
+            item_type TEXT NOT NULL,
+            key TEXT NOT NULL,
+            search_id INTEGER NOT NULL,
+            PRIMARY KEY (item_type, key, search_id)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS saved_search_key_delete AFTER DELETE ON saved_search
+        BEGIN
+            DELETE FROM saved_search_key WHERE item_type = OLD.item_type AND search_id = OLD.id;
+        END;
+
+        CREATE TABLE IF NOT EXISTS notification (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            read_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES user (id)
+        );
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_item
+        ON notification (user_id, item_type, item_id, kind);
+
+        CREATE INDEX IF NOT EXISTS idx_notification_unread
+        ON notification (user_id) WHERE read_at IS NULL;
+    ''')
+
+def _migration_13_marketplace_price_indexes(cur):
+    """Index marketplace price sorts and ranges, and cover the dashboard's facet counts.
+
+    Like the date indexes, each price index ends in the rowid, so it serves
+    the keyset order (price, id) in either direction without a sort step.
+    The facet index holds every column the facet query reads, so counting
+    per category and condition never touches the table itself.
+    """
+    _execute_script(cur, '''
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_price ON marketplace_item (price);
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_status_price ON marketplace_item (status, price);
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_category_price ON marketplace_item (category, price);
+        CREATE INDEX IF NOT EXISTS idx_marketplace_item_facets
+        ON marketplace_item (status, category, condition, price);
+    ''')
+
+def _migration_14_suggest_changes(cur):
+    """Log changes to item names, locations and categories for the autocomplete index.
+
+    Every insert, delete or edit of one of those fields appends (field,
+    value, +1/-1) rows to suggest_change.  Each worker's in-memory index
+    applies the rows past the last id it saw, so it follows every other
+    worker's writes without rebuilding.  Only the latest
+    SUGGEST_CHANGE_LOG_SIZE rows are kept; a worker that falls further
+    behind rebuilds from the item tables.
+    """
+    _execute_script(cur, f'''
+        CREATE TABLE IF NOT EXISTS suggest_change (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            delta INTEGER NOT NULL
+        );
+
+        CREATE TRIGGER IF NOT EXISTS suggest_change_prune AFTER INSERT ON suggest_change
+        BEGIN
+            DELETE FROM suggest_change WHERE id <= NEW.id - {SUGGEST_CHANGE_LOG_SIZE};
+        END;
+    ''')
+    for table in ('lost_found_item', 'marketplace_item'):
+        inserts = '\n'.join(f'''
+                INSERT INTO suggest_change (field, value, delta)
+                SELECT '{field}', NEW.{field}, 1 WHERE NEW.{field} IS NOT NULL;''' for field in SUGGEST_FIELDS)
+        deletes = '\n'.join(f'''
+                INSERT INTO suggest_change (field, value, delta)
+                SELECT '{field}', OLD.{field}, -1 WHERE OLD.{field} IS NOT NULL;''' for field in SUGGEST_FIELDS)
+        updates = '\n'.join(f'''
+                INSERT INTO suggest_change (field, value, delta)
+                SELECT '{field}', OLD.{field}, -1 WHERE OLD.{field} IS NOT NULL AND OLD.{field} IS NOT NEW.{field};
+                INSERT INTO suggest_change (field, value, delta)
+                SELECT '{field}', NEW.{field}, 1 WHERE NEW.{field} IS NOT NULL AND OLD.{field} IS NOT NEW.{field};'''
+                for field in SUGGEST_FIELDS)
+        _execute_script(cur, f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_suggest_insert AFTER INSERT ON {table}
+            BEGIN{inserts}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_suggest_delete AFTER DELETE ON {table}
+            BEGIN{deletes}
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS {table}_suggest_update AFTER UPDATE OF {', '.join(SUGGEST_FIELDS)} ON {table}
+            BEGIN{updates}
+            END;
+        ''')
+
+def _migration_15_page_versions(cur):
+    """Count changes per item table and per item, for conditional GETs of the pages showing them.
+
+    Every insert, update or delete of an item bumps its table's data version
+    and the item's row in item_version; new or removed feedback bumps its
+    item's version too, and any change to stored lost & found matches bumps
+    'lost_found_match'.  Items written before this migration start at
+    version 0.
+    """
+    _execute_script(cur, '''
+        INSERT OR IGNORE INTO data_version (name, version) VALUES
+            ('lost_found_item', 1), ('marketplace_item', 1), ('lost_found_match', 1);
+
+        CREATE TABLE IF NOT EXISTS item_version (
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (item_type, item_id)
+        ) WITHOUT ROWID;
+    ''')
+    bump_item = '''
+                INSERT INTO item_version (item_type, item_id, version) VALUES ({item_type}, {item_id}, 1)
+                ON CONFLICT (item_type, item_id) DO UPDATE SET version = version + 1;'''
+    for item_type, table in ITEM_TABLES.items():
+        for event in ('INSERT', 'UPDATE'):
+            _execute_script(cur, f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE name = '{table}';{bump_item.format(item_type=f"'{item_type}'", item_id='NEW.id')}
+                END;
+            ''')
+        _execute_script(cur, f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE data_version SET version = version + 1 WHERE name = '{table}';
+                DELETE FROM item_version WHERE item_type = '{item_type}' AND item_id = OLD.id;
+            END;
+        ''')
+    for event, row in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+        _execute_script(cur, f'''
+            CREATE TRIGGER IF NOT EXISTS feedback_version_{event.lower()} AFTER {event} ON feedback
+            BEGIN{bump_item.format(item_type=f'{row}.item_type', item_id=f'{row}.item_id')}
+            END;
+        ''')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS lost_found_match_version_{event.lower()} AFTER {event} ON lost_found_match
+            BEGIN
+                UPDATE data_version SET version = version + 1 WHERE name = 'lost_found_match';
+            END
+        ''')
+
+def _migration_16_saved_search_prefix_keys(cur):
+    """Re-file saved searches for prefix keyword matching and location cells.
+
+    Keyword keys become the keyword's first 6 characters (the 'p:' keys of
+    saved_searches.search_keys), and location-only searches move from the
+    catch-all '*' to the grid cells their circle overlaps.
+    """
+    cur.execute("UPDATE saved_search_key SET key = 'p:' || substr(key, 3, 6) WHERE key LIKE 't:%'")
+    cur.execute('''
+        SELECT s.id, s.item_type, s.latitude, s.longitude, s.radius_m FROM saved_search_key k
+        JOIN saved_search s ON s.id = k.search_id
+        WHERE k.key = '*' AND s.radius_m IS NOT NULL
+    ''')
+    for search_id, item_type, latitude, longitude, radius_m in cur.fetchall():
+        cells = geo_cells(latitude, longitude, radius_m)
+        if not cells:
+            continue
+        cur.execute("DELETE FROM saved_search_key WHERE search_id = ? AND key = '*'", (search_id,))
+        cur.executemany('INSERT INTO saved_search_key (item_type, key, search_id) VALUES (?, ?, ?)',
+                        [(item_type, 'g:%d:%d' % cell, search_id) for cell in cells])
+
+MIGRATIONS = [
+    _migration_1_base_schema,
+    _migration_2_indexes,
+    _migration_3_item_stats,
+    _migration_4_full_text_search,
+    _migration_5_geo_index,
+    _migration_6_data_versions,
+    _migration_7_image_jobs,
+    _migration_8_image_variants,
+    _migration_9_image_refs,
+    _migration_10_image_hashes,
+    _migration_11_match_index,
+    _migration_12_saved_searches,
+    _migration_13_marketplace_price_indexes,
+    _migration_14_suggest_changes,
+    _migration_15_page_versions,
+    _migration_16_saved_search_prefix_keys,
+]
+
+def get_schema_version():
+    """Return the schema version recorded in the database."""
+    return get_db_connection().execute('PRAGMA user_version').fetchone()[0]
 
-    conn.commit()
-    conn.close()
+def init_db():
+    """Bring the database schema up to date, applying any pending migrations."""
+    if get_schema_version() >= len(MIGRATIONS):
+        return
+    conn = get_db_connection()
+    cur = conn.cursor()
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE takes the write lock up front, so when several
+        # workers start together only one runs each step.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version() < number:
+                migration(cur)
+                conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 # User management functions
 def create_user(username, email, password):
     """Create a new user in the database."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     # Hash the password for security
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
     
     try:
-        cur.execute(
-            'INSERT INTO user (username, password, email, role, created_at) VALUES (?, ?, ?, ?, ?)',
-            (username, hashed_password, email, 'student', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        )
-        conn.commit()
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'INSERT INTO user (username, password, email, role, created_at) VALUES (?, ?, ?, ?, ?)',
+                (username, hashed_password, email, 'student', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
         return cur.lastrowid
     except sqlite3.IntegrityError:
         # Username or email already exists
         return False
-    finally:
-        conn.close()
 
 def verify_user(username, password):
     """Verify user credentials and return user data if valid."""
@@ -204,19 +812,72 @@ def verify_user(username, password):
         (username, hashed_password)
     )
     user = cur.fetchone()
-    conn.close()
     
     return dict(user) if user else None
 
+# User row caching
+#
+# A single request looks up the current user from load_user, the template
+# context processor and the view itself.  get_user_by_id() memoises rows on
+# ``g`` for the rest of the request and can also keep them in a process-wide
+# LRU for USER_CACHE_TTL seconds (0 turns that off).  Writes to the user table
+# must go through invalidate_user().
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 0))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def _cached_user_row(user_id):
+    if USER_CACHE_TTL <= 0:
+        return None
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _user_cache[user_id]
+            return None
+        _user_cache.move_to_end(user_id)
+        return entry[1]
+
+def _cache_user_row(user_id, user):
+    if USER_CACHE_TTL <= 0 or user is None:
+        return
+    with _user_cache_lock:
+        _user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL, user)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def invalidate_user(user_id):
+    """Drop a user's row from the request and process caches."""
+    user_id = int(user_id)
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    if has_app_context():
+        g.setdefault('user_rows', {}).pop(user_id, None)
+
 def get_user_by_id(user_id):
     """Get a user by their ID."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('SELECT * FROM user WHERE id = ?', (user_id,))
-    user = cur.fetchone()
-    conn.close()
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    request_cache = g.setdefault('user_rows', {}) if has_app_context() else {}
+    if user_id in request_cache:
+        user = request_cache[user_id]
+    else:
+        user = _cached_user_row(user_id)
+        if user is None:
+            cur = get_db_connection().cursor()
+            cur.execute('SELECT * FROM user WHERE id = ?', (user_id,))
+            row = cur.fetchone()
+            user = dict(row) if row else None
+            _cache_user_row(user_id, user)
+        request_cache[user_id] = user
     
+    # Callers are free to modify the dict they get back
     return dict(user) if user else None
 
 def get_user_by_username(username):
@@ -226,7 +887,6 @@ def get_user_by_username(username):
     
     cur.execute('SELECT * FROM user WHERE username = ?', (username,))
     user = cur.fetchone()
-    conn.close()
     
     return dict(user) if user else None
 
@@ -237,82 +897,277 @@ def get_user_by_email(email):
     
     cur.execute('SELECT * FROM user WHERE email = ?', (email,))
     user = cur.fetchone()
-    conn.close()
     
     return dict(user) if user else None
 
 def confirm_user(user_id):
     """Mark a user's email as confirmed."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('UPDATE user SET is_confirmed = 1 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('UPDATE user SET is_confirmed = 1 WHERE id = ?', (user_id,))
+    invalidate_user(user_id)
+
+def update_user_profile(user_id, update_data):
+    """Update the given columns of a user's row."""
+    update_fields = []
+    update_values = []
+
+    for key, value in update_data.items():
+        update_fields.append(f"{key} = ?")
+        update_values.append(value)
+
+    update_values.append(user_id)
+
+    try:
+        with transaction() as conn:
+            query = f"UPDATE user SET {', '.join(update_fields)} WHERE id = ?"
+            conn.execute(query, update_values)
+        invalidate_user(user_id)
+        return True
+    except Exception as e:
+        print(f"Error updating user profile: {e}")
+        return False
+
+def get_data_version(name):
+    """Return the change counter for ``name`` from the data_version table."""
+    cur = get_db_connection().cursor()
+    cur.execute('SELECT version FROM data_version WHERE name = ?', (name,))
+    row = cur.fetchone()
+    return row['version'] if row else 0
+
+def get_data_versions(*names):
+    """Return the change counters for ``names``, in the same order, from one query."""
+    cur = get_db_connection().cursor()
+    placeholders = ', '.join('?' for _ in names)
+    cur.execute(f'SELECT name, version FROM data_version WHERE name IN ({placeholders})', names)
+    versions = {row['name']: row['version'] for row in cur.fetchall()}
+    return tuple(versions.get(name, 0) for name in names)
+
+def get_item_version(item_type, item_id):
+    """Return the change counter of one item, which its edits and feedback bump."""
+    cur = get_db_connection().cursor()
+    cur.execute('SELECT version FROM item_version WHERE item_type = ? AND item_id = ?', (item_type, item_id))
+    row = cur.fetchone()
+    return row['version'] if row else 0
 
 # Category functions
+#
+# Categories are seeded once and rarely change, so they are served from an
+# in-memory registry.  Every CATEGORY_RECHECK_SECONDS the registry compares
+# the 'category' data version with the one it loaded and reloads if the
+# table was changed (by any worker, or by hand in the database).
+CATEGORY_RECHECK_SECONDS = float(os.environ.get('CATEGORY_RECHECK_SECONDS', 5))
+
+_category_registry = {'rows': None, 'version': None, 'checked_at': 0.0}
+_category_lock = threading.Lock()
+
+def load_categories():
+    """(Re)load the category registry from the database and return its rows."""
+    with _category_lock:
+        version = get_data_version('category')
+        cur = get_db_connection().cursor()
+        cur.execute('SELECT * FROM category ORDER BY id')
+        rows = [dict(row) for row in cur.fetchall()]
+        _category_registry['rows'] = rows
+        _category_registry['version'] = version
+        _category_registry['checked_at'] = time.monotonic()
+    return rows
+
 def get_categories(type=None):
     """Get all categories or by type."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    if type:
-        cur.execute('SELECT * FROM category WHERE type = ?', (type,))
-    else:
-        cur.execute('SELECT * FROM category')
-        
-    categories = [dict(row) for row in cur.fetchall()]
-    conn.close()
+    # Read the rows once; a concurrent reload swaps in a new list rather than changing this one
+    rows = _category_registry['rows']
+    if rows is None:
+        rows = load_categories()
+    elif time.monotonic() - _category_registry['checked_at'] > CATEGORY_RECHECK_SECONDS:
+        if get_data_version('category') != _category_registry['version']:
+            rows = load_categories()
+        else:
+            _category_registry['checked_at'] = time.monotonic()
     
-    return categories
+    return [dict(row) for row in rows if not type or row['type'] == type]
+
+# Keyset pagination helpers
+#
+# Dashboards are paged on a (sort value, id) pair instead of OFFSET so every
+# page is an index range scan no matter how deep the reader goes.  A cursor is
+# the pair for the first or last row of a page, encoded for use in a URL.
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 24))
+
+def encode_cursor(value, item_id):
+    """Encode a (sort value, id) pair as an opaque URL-safe cursor."""
+    raw = json.dumps([value, item_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+_SQLITE_INT_MIN, _SQLITE_INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+def decode_cursor(cursor):
+    """Decode a cursor made by ``encode_cursor``; return None if it is invalid."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except ValueError:
+        return None
+    # Only a [sort value, id] pair of plain scalars may reach the query
+    if not isinstance(payload, list) or len(payload) != 2:
+        return None
+    value, item_id = payload
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    if isinstance(item_id, bool) or not isinstance(item_id, int):
+        return None
+    # SQLite binds 64-bit integers and finite reals only; anything else would raise
+    if not _SQLITE_INT_MIN <= item_id <= _SQLITE_INT_MAX:
+        return None
+    if isinstance(value, int) and not _SQLITE_INT_MIN <= value <= _SQLITE_INT_MAX:
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value, item_id
+
+def _paginate(query, conditions, params, sort_col, sort_key, after=None, before=None, limit=PAGE_SIZE,
+              descending=True):
+    """Fetch one page of ``query`` ordered by (sort_col, id), descending unless ``descending`` is False.
+
+    ``after`` continues past the last row of the previous page, ``before``
+    walks back from the first row of the next one.  Returns a dict with the
+    page's ``items`` and the ``next_cursor``/``prev_cursor`` to link to.
+    """
+    conditions = list(conditions)
+    params = list(params)
+    before_cursor = decode_cursor(before)
+    cursor = before_cursor or decode_cursor(after)
+    backwards = before_cursor is not None
+    # Walking back from a cursor reads rows in the opposite order
+    ascending = backwards == descending
+
+    if cursor:
+        conditions.append(f"({sort_col}, i.id) {'>' if ascending else '<'} (?, ?)")
+        params.extend(cursor)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    direction = 'ASC' if ascending else 'DESC'
+    query += f" ORDER BY {sort_col} {direction}, i.id {direction} LIMIT ?"
+    params.append(limit + 1)
+
+    cur = get_db_connection().cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    items = [dict(row) for row in rows[:limit]]
+    if backwards:
+        items.reverse()
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or backwards:
+            next_cursor = encode_cursor(items[-1][sort_key], items[-1]['id'])
+        if (has_more and backwards) or (cursor and not backwards):
+            prev_cursor = encode_cursor(items[0][sort_key], items[0]['id'])
+    return {'items': items, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+def _fts_query(text):
+    """Turn free text from a search box into an FTS5 query.
+
+    Every word must match, as a prefix, so "calc boo" finds "Calculus book".
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+def _filter_conditions(filters, allowed, ranges=None):
+    """Turn a filters dict into SQL conditions, ignoring unknown or empty keys.
+
+    Keys in ``allowed`` must equal their value; ``ranges`` maps further keys
+    to the condition they add, such as ``{'min_price': 'i.price >= ?'}``.
+    """
+    conditions = []
+    params = []
+    for key, value in (filters or {}).items():
+        if value in (None, ''):
+            continue
+        if key in allowed:
+            conditions.append(f"i.{key} = ?")
+            params.append(value)
+        elif ranges and key in ranges:
+            conditions.append(ranges[key])
+            params.append(value)
+    return conditions, params
+
+def get_item_stats(item_type):
+    """Get item counts for 'lost_found' or 'marketplace' from the item_stats table.
+
+    Returns a dict with the overall ``total`` and ``by_status``/``by_category``
+    breakdowns.  The table holds one row per (status, category) pair, so this
+    costs the same however many items exist.
+    """
+    cur = get_db_connection().cursor()
+    cur.execute('SELECT status, category, total FROM item_stats WHERE item_type = ? AND total > 0',
+                (item_type,))
+    stats = {'total': 0, 'by_status': {}, 'by_category': {}}
+    for row in cur.fetchall():
+        stats['total'] += row['total']
+        stats['by_status'][row['status']] = stats['by_status'].get(row['status'], 0) + row['total']
+        stats['by_category'][row['category']] = stats['by_category'].get(row['category'], 0) + row['total']
+    return stats
 
 # Lost & Found item functions
 def create_lost_found_item(item_data):
     """Create a new lost & found item."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     # Add current date if not provided
     if 'date' not in item_data or not item_data['date']:
         item_data['date'] = datetime.now().strftime('%Y-%m-%d')
     
     try:
-        cur.execute('''
-            INSERT INTO lost_found_item (
-                name, description, category, status, priority, image_path, 
-                date, location, contact_info, latitude, longitude, user_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            item_data['name'], 
-            item_data.get('description'), 
-            item_data.get('category'),
-            item_data['status'],
-            item_data.get('priority', 1),
-            item_data.get('image_path'),
-            item_data['date'],
-            item_data.get('location'),
-            item_data.get('contact_info'),
-            item_data.get('latitude'),
-            item_data.get('longitude'),
-            item_data['user_id']
-        ))
-        conn.commit()
-        return cur.lastrowid
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO lost_found_item (
+                    name, description, category, status, priority, image_path, image_status,
+                    date, location, contact_info, latitude, longitude, user_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                item_data['name'], 
+                item_data.get('description'), 
+                item_data.get('category'),
+                item_data['status'],
+                item_data.get('priority', 1),
+                item_data.get('image_path'),
+                item_data.get('image_status', 'ready'),
+                item_data['date'],
+                item_data.get('location'),
+                item_data.get('contact_info'),
+                item_data.get('latitude'),
+                item_data.get('longitude'),
+                item_data['user_id']
+            ))
+            item_id = cur.lastrowid
+            _index_lost_found_tokens(cur, item_id, item_data['name'], item_data.get('description'),
+                                     item_data['status'], item_data['date'])
+        return item_id
     except Exception as e:
         print(f"Error creating lost & found item: {e}")
         return False
-    finally:
-        conn.close()
+
+# Lost & found rows carry the reporter's, finder's and claimer's usernames,
+# resolved in the same statement rather than with a lookup per row
+_LOST_FOUND_SELECT = '''
+    SELECT i.*, u.username,
+           f.username AS found_by_user,
+           c.username AS claimed_by_user
+    FROM lost_found_item i
+    JOIN user u ON i.user_id = u.id
+    LEFT JOIN user f ON i.found_by = f.id
+    LEFT JOIN user c ON i.claimed_by = c.id
+'''
 
 def get_lost_found_items(order_by=None, filters=None):
     """Get lost & found items with optional ordering and filtering."""
     conn = get_db_connection()
     cur = conn.cursor()
     
-    query = '''
-        SELECT i.*, u.username 
-        FROM lost_found_item i
-        JOIN user u ON i.user_id = u.id
-    '''
+    query = _LOST_FOUND_SELECT
     
     params = []
     
@@ -330,32 +1185,163 @@ def get_lost_found_items(order_by=None, filters=None):
     
     cur.execute(query, params)
     items = [dict(row) for row in cur.fetchall()]
-    conn.close()
     
     return items
 
+# Sort orders and filterable columns for the lost & found dashboard
+LOST_FOUND_ORDERS = {'date': 'i.date', 'priority': 'i.priority'}
+LOST_FOUND_FILTERS = ('status', 'priority', 'category', 'user_id')
+
+def get_lost_found_page(order='date', filters=None, after=None, before=None, limit=PAGE_SIZE):
+    """Get one keyset page of lost & found items, newest or highest priority first."""
+    if order not in LOST_FOUND_ORDERS:
+        order = 'date'
+    conditions, params = _filter_conditions(filters, LOST_FOUND_FILTERS)
+    return _paginate(_LOST_FOUND_SELECT, conditions, params, LOST_FOUND_ORDERS[order], order,
+                     after=after, before=before, limit=limit)
+
+_LOST_FOUND_SEARCH = '''
+    SELECT i.*, u.username,
+           f.username AS found_by_user,
+           c.username AS claimed_by_user,
+           -lost_found_fts.rank AS relevance
+    FROM lost_found_fts
+    JOIN lost_found_item i ON i.id = lost_found_fts.rowid
+    JOIN user u ON i.user_id = u.id
+    LEFT JOIN user f ON i.found_by = f.id
+    LEFT JOIN user c ON i.claimed_by = c.id
+'''
+
+def search_lost_found_items(text, filters=None, after=None, before=None, limit=PAGE_SIZE):
+    """Full-text search lost & found items, best matches first, one keyset page at a time."""
+    fts_query = _fts_query(text)
+    if not fts_query:
+        return get_lost_found_page('date', filters, after=after, before=before, limit=limit)
+    conditions, params = _filter_conditions(filters, LOST_FOUND_FILTERS)
+    return _paginate(_LOST_FOUND_SEARCH, ['lost_found_fts MATCH ?'] + conditions, [fts_query] + params,
+                     '-lost_found_fts.rank', 'relevance', after=after, before=before, limit=limit)
+
+EARTH_RADIUS_M = 6371000
+
+def is_coordinate(value):
+    """Whether ``value`` is a usable coordinate.
+
+    Older rows store a missing coordinate as '' rather than NULL; like
+    migration 5, only SQLite integers and reals count.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def parse_coordinate(value):
+    """Parse a latitude/longitude/radius from a form or query string; None if it is blank or invalid."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def has_location(row):
+    """Whether ``row`` has a usable latitude and longitude."""
+    return is_coordinate(row.get('latitude')) and is_coordinate(row.get('longitude'))
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between two points given in degrees."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+# Default and largest radius of a "near me" search or saved search, in metres
+NEAR_ME_RADIUS_M = 1000
+NEAR_ME_MAX_RADIUS_M = 20000
+
+# Coarse grid used to index location-only saved searches
+GEO_CELL_DEGREES = 0.1
+MAX_GEO_CELLS = 64
+
+def geo_cell(lat, lon):
+    """The (row, column) of the GEO_CELL_DEGREES grid cell holding a point."""
+    return math.floor(lat / GEO_CELL_DEGREES), math.floor(lon / GEO_CELL_DEGREES)
+
+def geo_cells(lat, lon, radius_m):
+    """The grid cells the bounding box of a circle overlaps.
+
+    Returns None if that is more than MAX_GEO_CELLS cells, or the box
+    crosses a pole or the antimeridian.
+    """
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    if abs(lat) + dlat > 90 or abs(lon) + dlon > 180:
+        return None
+    (row_min, col_min), (row_max, col_max) = geo_cell(lat - dlat, lon - dlon), geo_cell(lat + dlat, lon + dlon)
+    if (row_max - row_min + 1) * (col_max - col_min + 1) > MAX_GEO_CELLS:
+        return None
+    return [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+
+def get_lost_found_items_near(lat, lon, radius_m, filters=None, limit=PAGE_SIZE, text=None):
+    """Get the lost & found items within ``radius_m`` metres of a point, nearest first.
+
+    The R*Tree narrows the search to a bounding box around the point; the
+    exact haversine distance then drops the box's corners.  ``text``, if
+    given, must match as in ``search_lost_found_items``.  Each item gets a
+    ``distance_m`` key.
+    """
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    conditions, params = _filter_conditions(filters, LOST_FOUND_FILTERS)
+    fts_query = _fts_query(text) if text else None
+    if fts_query:
+        conditions.append('i.id IN (SELECT rowid FROM lost_found_fts WHERE lost_found_fts MATCH ?)')
+        params.append(fts_query)
+    conditions = ['g.min_lat <= ?', 'g.max_lat >= ?', 'g.min_lon <= ?', 'g.max_lon >= ?'] + conditions
+    params = [lat + dlat, lat - dlat, lon + dlon, lon - dlon] + params
+    query = _LOST_FOUND_SELECT + ' JOIN lost_found_geo g ON g.id = i.id WHERE ' + ' AND '.join(conditions)
+
+    cur = get_db_connection().cursor()
+    cur.execute(query, params)
+    items = []
+    for row in cur.fetchall():
+        item = dict(row)
+        item['distance_m'] = haversine_m(lat, lon, item['latitude'], item['longitude'])
+        if item['distance_m'] <= radius_m:
+            items.append(item)
+    items.sort(key=lambda item: item['distance_m'])
+    return items[:limit]
+
 def get_lost_found_item(item_id):
     """Get a specific lost & found item by ID."""
     conn = get_db_connection()
     cur = conn.cursor()
     
-    cur.execute('''
-        SELECT i.*, u.username 
-        FROM lost_found_item i
-        JOIN user u ON i.user_id = u.id
-        WHERE i.id = ?
-    ''', (item_id,))
+    cur.execute(_LOST_FOUND_SELECT + ' WHERE i.id = ?', (item_id,))
     
     item = cur.fetchone()
-    conn.close()
     
     return dict(item) if item else None
 
-def update_lost_found_item(item_id, item_data):
-    """Update an existing lost & found item."""
+def get_lost_found_items_by_ids(item_ids):
+    """Get lost & found items by ID, in the order given."""
+    if not item_ids:
+        return []
     conn = get_db_connection()
     cur = conn.cursor()
-    
+    placeholders = ', '.join('?' for _ in item_ids)
+    cur.execute(_LOST_FOUND_SELECT + f' WHERE i.id IN ({placeholders})', list(item_ids))
+    items = {row['id']: dict(row) for row in cur.fetchall()}
+    return [items[item_id] for item_id in item_ids if item_id in items]
+
+def get_open_image_hashes():
+    """Get (id, status, image_hash) of every lost or found item with a processed image."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT id, status, image_hash FROM lost_found_item
+        WHERE status IN ('lost', 'found') AND image_status = 'ready' AND image_hash IS NOT NULL
+    ''')
+    return cur.fetchall()
+
+def update_lost_found_item(item_id, item_data):
+    """Update an existing lost & found item."""
     # Prepare update fields and values
     update_fields = []
     update_values = []
@@ -368,79 +1354,139 @@ def update_lost_found_item(item_id, item_data):
     update_values.append(item_id)
     
     try:
-        query = f"UPDATE lost_found_item SET {', '.join(update_fields)} WHERE id = ?"
-        cur.execute(query, update_values)
-        conn.commit()
+        with transaction() as conn:
+            query = f"UPDATE lost_found_item SET {', '.join(update_fields)} WHERE id = ?"
+            cur = conn.cursor()
+            cur.execute(query, update_values)
+            # Status and date changes reach the token index through a trigger
+            if 'name' in item_data or 'description' in item_data:
+                cur.execute('SELECT name, description, status, date FROM lost_found_item WHERE id = ?', (item_id,))
+                row = cur.fetchone()
+                if row:
+                    _index_lost_found_tokens(cur, item_id, *row)
         return True
     except Exception as e:
         print(f"Error updating lost & found item: {e}")
         return False
-    finally:
-        conn.close()
 
 def delete_lost_found_item(item_id):
     """Delete a lost & found item by ID."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     try:
-        cur.execute('DELETE FROM lost_found_item WHERE id = ?', (item_id,))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute('DELETE FROM lost_found_item WHERE id = ?', (item_id,))
         return True
     except Exception as e:
         print(f"Error deleting lost & found item: {e}")
         return False
-    finally:
-        conn.close()
+
+# Lost & found matching
+#
+# lost_found_token is an inverted index of each item's name and description
+# tokens, keyed (token, status, day) so the matching engine can fetch just
+# the opposite-status items inside its date window that share a token.
+# Token rows are written with the item; status and date changes and deletes
+# are mirrored by triggers.  lost_found_match holds each item's top matches.
+ITEM_TOKEN_LIMIT = 32
+OPPOSITE_STATUS = {'lost': 'found', 'found': 'lost'}
+
+def _index_lost_found_tokens(cur, item_id, name, description, status, date):
+    """Replace an item's rows in the token index."""
+    cur.execute('DELETE FROM lost_found_token WHERE item_id = ?', (item_id,))
+    cur.executemany(
+        'INSERT OR IGNORE INTO lost_found_token (token, status, day, item_id) VALUES (?, ?, ?, ?)',
+        [(token, status, (date or '')[:10], item_id)
+         for token in tokens.tokenize(name, description, limit=ITEM_TOKEN_LIMIT)]
+    )
+
+def get_token_postings(query_tokens, status, start_day, end_day):
+    """Get (token, item_id) pairs for ``status`` items dated within [start_day, end_day] sharing a token."""
+    if not query_tokens:
+        return []
+    conn = get_db_connection()
+    cur = conn.cursor()
+    placeholders = ', '.join('?' for _ in query_tokens)
+    cur.execute(f'''
+        SELECT token, item_id FROM lost_found_token
+        WHERE token IN ({placeholders}) AND status = ? AND day BETWEEN ? AND ?
+    ''', [*query_tokens, status, start_day, end_day])
+    return [(row['token'], row['item_id']) for row in cur.fetchall()]
+
+def save_lost_found_matches(item_id, matches, top_k, rescored=(), unmatched=()):
+    """Store an item's matches as [(match_id, score)] and offer the item to each match's own list.
+
+    Matching is symmetric, so every match also gets this item in its list,
+    which is then trimmed back to its ``top_k`` best.  Other items keep this
+    one in their lists: those in ``rescored`` [(match_id, score)], scored
+    again but outside this item's own top, get the new score, and those in
+    ``unmatched`` (those it no longer matches) drop it.
+    """
+    with transaction() as conn:
+        conn.execute('DELETE FROM lost_found_match WHERE item_id = ?', (item_id,))
+        conn.executemany('INSERT INTO lost_found_match (item_id, match_id, score) VALUES (?, ?, ?)',
+                         [(item_id, match_id, score) for match_id, score in matches])
+        conn.executemany('UPDATE lost_found_match SET score = ? WHERE item_id = ? AND match_id = ?',
+                         [(score, match_id, item_id) for match_id, score in rescored])
+        conn.executemany('DELETE FROM lost_found_match WHERE item_id = ? AND match_id = ?',
+                         [(match_id, item_id) for match_id in unmatched])
+        conn.executemany('INSERT OR REPLACE INTO lost_found_match (item_id, match_id, score) VALUES (?, ?, ?)',
+                         [(match_id, item_id, score) for match_id, score in matches])
+        for match_id, _ in matches:
+            conn.execute('''
+                DELETE FROM lost_found_match WHERE item_id = ? AND match_id NOT IN (
+                    SELECT match_id FROM lost_found_match WHERE item_id = ? ORDER BY score DESC LIMIT ?
+                )
+            ''', (match_id, match_id, top_k))
+
+def get_lost_found_match_holders(item_id):
+    """Get the ids of items whose stored matches include ``item_id``."""
+    cur = get_db_connection().cursor()
+    cur.execute('SELECT item_id FROM lost_found_match WHERE match_id = ?', (item_id,))
+    return [row['item_id'] for row in cur.fetchall()]
+
+def get_lost_found_matches(item_id):
+    """Get an item's stored matches that are still open, best first, each with its ``match_score``."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT match_id, score FROM lost_found_match WHERE item_id = ? ORDER BY score DESC', (item_id,))
+    scores = {row['match_id']: row['score'] for row in cur.fetchall()}
+    items = [item for item in get_lost_found_items_by_ids(list(scores)) if item['status'] in OPPOSITE_STATUS]
+    for item in items:
+        item['match_score'] = scores[item['id']]
+    return items
 
 # Marketplace item functions
 def create_marketplace_item(item_data):
     """Create a new marketplace item."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     # Add current date if not provided
     if 'date' not in item_data or not item_data['date']:
         item_data['date'] = datetime.now().strftime('%Y-%m-%d')
     
     try:
-        print(f"DEBUG - Inserting marketplace item: {item_data['name']}")
-        cur.execute('''
-            INSERT INTO marketplace_item (
-                name, description, price, category, condition, status, 
-                image_path, date, location, contact_info, user_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            item_data['name'], 
-            item_data.get('description'), 
-            item_data['price'],
-            item_data.get('category'),
-            item_data.get('condition'),
-            item_data['status'],
-            item_data.get('image_path'),
-            item_data['date'],
-            item_data.get('location'),
-            item_data.get('contact_info'),
-            item_data['user_id']
-        ))
-        conn.commit()
-        item_id = cur.lastrowid
-        print(f"DEBUG - Marketplace item created with ID: {item_id}")
-        
-        # Verify insertion
-        cur.execute('SELECT * FROM marketplace_item WHERE id = ?', (item_id,))
-        item = cur.fetchone()
-        if item:
-            print(f"DEBUG - Item verification successful: {dict(item)}")
-        else:
-            print(f"DEBUG - Item verification failed - No item found with ID: {item_id}")
-        
-        return item_id
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO marketplace_item (
+                    name, description, price, category, condition, status, 
+                    image_path, image_status, date, location, contact_info, user_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                item_data['name'], 
+                item_data.get('description'), 
+                item_data['price'],
+                item_data.get('category'),
+                item_data.get('condition'),
+                item_data['status'],
+                item_data.get('image_path'),
+                item_data.get('image_status', 'ready'),
+                item_data['date'],
+                item_data.get('location'),
+                item_data.get('contact_info'),
+                item_data['user_id']
+            ))
+        return cur.lastrowid
     except Exception as e:
-        print(f"ERROR creating marketplace item: {e}")
+        print(f"Error creating marketplace item: {e}")
         return False
-    finally:
-        conn.close()
 
 def get_marketplace_items(order_by=None, filters=None):
     """Get marketplace items with optional ordering and filtering."""
@@ -467,20 +1513,93 @@ def get_marketplace_items(order_by=None, filters=None):
     if order_by:
         query += f" ORDER BY i.{order_by}"
     
-    print(f"DEBUG - Executing marketplace query: {query}")
     cur.execute(query, params)
     items = [dict(row) for row in cur.fetchall()]
-    print(f"DEBUG - Found {len(items)} marketplace items")
-    
-    # Also check directly using a separate query for verification
-    cur.execute("SELECT COUNT(*) FROM marketplace_item")
-    count = cur.fetchone()[0]
-    print(f"DEBUG - Direct count of marketplace_item table: {count}")
-    
-    conn.close()
     
     return items
 
+# Sort orders for the marketplace dashboard: (sort column, row key, descending)
+MARKETPLACE_ORDERS = {
+    'date': ('i.date', 'date', True),
+    'price_asc': ('i.price', 'price', False),
+    'price_desc': ('i.price', 'price', True),
+}
+# Filterable columns, and the price range filters
+MARKETPLACE_FILTERS = ('status', 'category', 'condition', 'user_id')
+MARKETPLACE_RANGES = {'min_price': 'i.price >= ?', 'max_price': 'i.price <= ?'}
+
+_MARKETPLACE_SELECT = '''
+    SELECT i.*, u.username
+    FROM marketplace_item i
+    JOIN user u ON i.user_id = u.id
+'''
+_MARKETPLACE_MATCH = 'i.id IN (SELECT rowid FROM marketplace_fts WHERE marketplace_fts MATCH ?)'
+
+def get_marketplace_page(order='date', filters=None, after=None, before=None, limit=PAGE_SIZE):
+    """Get one keyset page of marketplace items, newest, cheapest or dearest first."""
+    if order not in MARKETPLACE_ORDERS:
+        order = 'date'
+    sort_col, sort_key, descending = MARKETPLACE_ORDERS[order]
+    conditions, params = _filter_conditions(filters, MARKETPLACE_FILTERS, MARKETPLACE_RANGES)
+    return _paginate(_MARKETPLACE_SELECT, conditions, params, sort_col, sort_key,
+                     after=after, before=before, limit=limit, descending=descending)
+
+_MARKETPLACE_SEARCH = '''
+    SELECT i.*, u.username,
+           -marketplace_fts.rank AS relevance
+    FROM marketplace_fts
+    JOIN marketplace_item i ON i.id = marketplace_fts.rowid
+    JOIN user u ON i.user_id = u.id
+'''
+
+def search_marketplace_items(text, filters=None, after=None, before=None, limit=PAGE_SIZE, order=None):
+    """Full-text search marketplace items one keyset page at a time.
+
+    Best matches come first unless ``order`` names one of MARKETPLACE_ORDERS.
+    """
+    fts_query = _fts_query(text)
+    if not fts_query:
+        return get_marketplace_page(order or 'date', filters, after=after, before=before, limit=limit)
+    conditions, params = _filter_conditions(filters, MARKETPLACE_FILTERS, MARKETPLACE_RANGES)
+    if order in MARKETPLACE_ORDERS:
+        sort_col, sort_key, descending = MARKETPLACE_ORDERS[order]
+        return _paginate(_MARKETPLACE_SELECT, [_MARKETPLACE_MATCH] + conditions, [fts_query] + params,
+                         sort_col, sort_key, after=after, before=before, limit=limit, descending=descending)
+    return _paginate(_MARKETPLACE_SEARCH, ['marketplace_fts MATCH ?'] + conditions, [fts_query] + params,
+                     '-marketplace_fts.rank', 'relevance', after=after, before=before, limit=limit)
+
+# Columns the marketplace dashboard shows counts for
+MARKETPLACE_FACETS = ('category', 'condition')
+
+def get_marketplace_facets(filters=None, text=None):
+    """Count the marketplace items matching ``filters`` (and search ``text``) per category and per condition.
+
+    Each facet's counts ignore the filter on that facet itself, so picking a
+    category still shows how many items the other categories hold.  Both
+    facets come back from one UNION ALL query as ``{facet: {value: count}}``.
+    """
+    fts_query = _fts_query(text) if text else None
+    parts = []
+    params = []
+    for facet in MARKETPLACE_FACETS:
+        others = {key: value for key, value in (filters or {}).items() if key != facet}
+        conditions, facet_params = _filter_conditions(others, MARKETPLACE_FILTERS, MARKETPLACE_RANGES)
+        if fts_query:
+            conditions.append(_MARKETPLACE_MATCH)
+            facet_params.append(fts_query)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        parts.append(f"SELECT '{facet}' AS facet, i.{facet} AS value, COUNT(*) AS total "
+                     f"FROM marketplace_item i{where} GROUP BY i.{facet}")
+        params.extend(facet_params)
+
+    cur = get_db_connection().cursor()
+    cur.execute(' UNION ALL '.join(parts), params)
+    facets = {facet: {} for facet in MARKETPLACE_FACETS}
+    for row in cur.fetchall():
+        if row['value'] is not None:
+            facets[row['facet']][row['value']] = row['total']
+    return facets
+
 def get_marketplace_item(item_id):
     """Get a specific marketplace item by ID."""
     conn = get_db_connection()
@@ -494,15 +1613,11 @@ def get_marketplace_item(item_id):
     ''', (item_id,))
     
     item = cur.fetchone()
-    conn.close()
     
     return dict(item) if item else None
 
 def update_marketplace_item(item_id, item_data):
     """Update an existing marketplace item."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     # Prepare update fields and values
     update_fields = []
     update_values = []
@@ -515,46 +1630,36 @@ def update_marketplace_item(item_id, item_data):
     update_values.append(item_id)
     
     try:
-        query = f"UPDATE marketplace_item SET {', '.join(update_fields)} WHERE id = ?"
-        cur.execute(query, update_values)
-        conn.commit()
+        with transaction() as conn:
+            query = f"UPDATE marketplace_item SET {', '.join(update_fields)} WHERE id = ?"
+            conn.execute(query, update_values)
         return True
     except Exception as e:
         print(f"Error updating marketplace item: {e}")
         return False
-    finally:
-        conn.close()
 
 def delete_marketplace_item(item_id):
     """Delete a marketplace item by ID."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     try:
-        cur.execute('DELETE FROM marketplace_item WHERE id = ?', (item_id,))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute('DELETE FROM marketplace_item WHERE id = ?', (item_id,))
         return True
     except Exception as e:
         print(f"Error deleting marketplace item: {e}")
         return False
-    finally:
-        conn.close()
 
 def create_feedback(user_id, item_type, item_id, comment):
     """Add a feedback comment for lost_found or marketplace item"""
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            'INSERT INTO feedback (user_id, item_type, item_id, comment) VALUES (?, ?, ?, ?)',
-            (user_id, item_type, item_id, comment)
-        )
-        conn.commit()
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'INSERT INTO feedback (user_id, item_type, item_id, comment) VALUES (?, ?, ?, ?)',
+                (user_id, item_type, item_id, comment)
+            )
         return cur.lastrowid
     except Exception:
         return False
-    finally:
-        conn.close()
 
 
 def get_feedback_for_item(item_type, item_id):
@@ -566,5 +1671,274 @@ def get_feedback_for_item(item_type, item_id):
         (item_type, item_id)
     )
     feedback = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    return feedback
\ No newline at end of file
+    return feedback
+
+def get_feedback(feedback_id):
+    """Get one feedback comment with its author's username."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT f.*, u.username FROM feedback f JOIN user u ON f.user_id = u.id WHERE f.id = ?',
+                (feedback_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+# Saved searches and notifications
+#
+# saved_search_key files each saved search under keys one of which every item
+# it matches must carry (see saved_searches.search_keys), so a new item
+# fetches only the searches that could match it by probing with its own keys.
+# Notifications are unique per user, item and kind, so re-running a check
+# never queues the same news twice.
+def create_saved_search(search, keys):
+    """Save a search and file it in the key index under ``keys``; return its id."""
+    try:
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO saved_search (
+                    user_id, item_type, query, category, status, latitude, longitude, radius_m
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                search['user_id'],
+                search['item_type'],
+                search.get('query'),
+                search.get('category'),
+                search.get('status'),
+                search.get('latitude'),
+                search.get('longitude'),
+                search.get('radius_m')
+            ))
+            search_id = cur.lastrowid
+            cur.executemany('INSERT INTO saved_search_key (item_type, key, search_id) VALUES (?, ?, ?)',
+                            [(search['item_type'], key, search_id) for key in keys])
+        return search_id
+    except Exception as e:
+        print(f"Error saving search: {e}")
+        return False
+
+def get_saved_searches(user_id):
+    """Get a user's saved searches, newest first."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM saved_search WHERE user_id = ? ORDER BY id DESC', (user_id,))
+    return [dict(row) for row in cur.fetchall()]
+
+def delete_saved_search(search_id, user_id):
+    """Delete one of a user's saved searches; return whether it existed."""
+    try:
+        with transaction() as conn:
+            cur = conn.execute('DELETE FROM saved_search WHERE id = ? AND user_id = ?', (search_id, user_id))
+        return cur.rowcount > 0
+    except Exception as e:
+        print(f"Error deleting saved search: {e}")
+        return False
+
+def get_candidate_searches(item_type, keys):
+    """Get the saved searches for ``item_type`` filed under any of ``keys``."""
+    if not keys:
+        return []
+    conn = get_db_connection()
+    cur = conn.cursor()
+    placeholders = ', '.join('?' for _ in keys)
+    cur.execute(f'''
+        SELECT s.* FROM saved_search_key k
+        JOIN saved_search s ON s.id = k.search_id
+        WHERE k.item_type = ? AND k.key IN ({placeholders})
+    ''', [item_type, *keys])
+    return [dict(row) for row in cur.fetchall()]
+
+def queue_notifications(notifications):
+    """Queue notifications, skipping any the user already has; return those queued."""
+    queued = []
+    with transaction() as conn:
+        for note in notifications:
+            cur = conn.execute('''
+                INSERT OR IGNORE INTO notification (user_id, kind, item_type, item_id, message)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (note['user_id'], note['kind'], note['item_type'], note['item_id'], note['message']))
+            if cur.rowcount:
+                queued.append(dict(note, id=cur.lastrowid))
+    return queued
+
+def get_notifications(user_id, limit=50):
+    """Get a user's most recent notifications, newest first."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM notification WHERE user_id = ? ORDER BY id DESC LIMIT ?', (user_id, limit))
+    return [dict(row) for row in cur.fetchall()]
+
+def count_unread_notifications(user_id):
+    """Count a user's unread notifications."""
+    conn = get_db_connection()
+    return conn.execute('SELECT COUNT(*) FROM notification WHERE user_id = ? AND read_at IS NULL',
+                        (user_id,)).fetchone()[0]
+
+def mark_notifications_read(user_id):
+    """Mark all of a user's notifications as read."""
+    try:
+        with transaction() as conn:
+            conn.execute('''
+                UPDATE notification SET read_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND read_at IS NULL
+            ''', (user_id,))
+        return True
+    except Exception as e:
+        print(f"Error marking notifications read: {e}")
+        return False
+
+# Autocomplete sources
+#
+# The autocomplete index (see autocomplete.py) is built from the item tables
+# once and then kept current from the suggest_change log, which triggers on
+# both item tables append to.
+SUGGEST_FIELDS = ('name', 'location', 'category')
+SUGGEST_CHANGE_LOG_SIZE = 10000
+
+def get_suggest_snapshot():
+    """Get every item's (name, location, category) and the last suggest_change id they include.
+
+    Both are read in one transaction, so applying the changes after that id
+    later counts each write exactly once.
+    """
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    try:
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM suggest_change').fetchone()[0]
+        rows = conn.execute('''
+            SELECT name, location, category FROM lost_found_item
+            UNION ALL
+            SELECT name, location, category FROM marketplace_item
+        ''').fetchall()
+    finally:
+        conn.commit()
+    return [tuple(row) for row in rows], last_id
+
+def get_suggest_changes(after_id):
+    """Get (id, field, value, delta) rows logged after ``after_id``, or None if some were already pruned."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT id, field, value, delta FROM suggest_change WHERE id > ? ORDER BY id', (after_id,))
+    rows = [tuple(row) for row in cur.fetchall()]
+    if rows and rows[0][0] != after_id + 1:
+        oldest = conn.execute('SELECT MIN(id) FROM suggest_change').fetchone()[0]
+        if oldest > after_id + 1:
+            return None
+    return rows
+
+# Image processing jobs
+#
+# Uploads are stored raw and the item is saved with image_status
+# 'processing'; image_worker turns each job into the final image and flips
+# the item to 'ready' (or 'failed' once its attempts run out).
+ITEM_TABLES = {'lost_found': 'lost_found_item', 'marketplace': 'marketplace_item'}
+
+def create_image_job(item_type, item_id, raw_path, image_path, replaced_path=None):
+    """Queue processing of a stored raw upload into an item's image_path."""
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            'INSERT INTO image_job (item_type, item_id, raw_path, image_path, replaced_path) VALUES (?, ?, ?, ?, ?)',
+            (item_type, item_id, raw_path, image_path, replaced_path)
+        )
+    return cur.lastrowid
+
+def claim_image_job(job_id):
+    """Mark a pending job as running and return it, or None if another worker took it."""
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            UPDATE image_job SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'pending'
+        ''', (job_id,))
+        if cur.rowcount == 0:
+            return None
+        cur.execute('SELECT * FROM image_job WHERE id = ?', (job_id,))
+        return dict(cur.fetchone())
+
+def complete_image_job(job, variants=None, image_hash=None):
+    """Mark a job done and its item's image ready, unless the item has moved on to another image.
+
+    ``variants`` and ``image_hash`` are what images.process_upload returned.
+    """
+    table = ITEM_TABLES[job['item_type']]
+    with transaction() as conn:
+        conn.execute(f'''
+            UPDATE {table} SET image_status = 'ready', image_variants = ?, image_hash = ?
+            WHERE id = ? AND image_path = ?
+        ''', (json.dumps(variants) if variants else None, image_hash, job['item_id'], job['image_path']))
+        conn.execute("UPDATE image_job SET status = 'done', error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     (job['id'],))
+
+def fail_image_job(job, error, retry):
+    """Record a failed attempt; put the job back in the queue or give up on it."""
+    table = ITEM_TABLES[job['item_type']]
+    with transaction() as conn:
+        conn.execute("UPDATE image_job SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     ('pending' if retry else 'failed', error, job['id']))
+        if not retry:
+            conn.execute(f"UPDATE {table} SET image_status = 'failed' WHERE id = ? AND image_path = ?",
+                         (job['item_id'], job['image_path']))
+
+def get_processed_image(image_path):
+    """Get ``{'variants', 'image_hash'}`` already recorded for a stored image, or None.
+
+    Identical uploads share one content-addressed image_path, so a job can
+    reuse the work done for another item.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    for table in ITEM_TABLES.values():
+        cur.execute(f'''
+            SELECT image_variants, image_hash FROM {table}
+            WHERE image_path = ? AND image_status = 'ready'
+              AND image_variants IS NOT NULL AND image_hash IS NOT NULL
+            LIMIT 1
+        ''', (image_path,))
+        row = cur.fetchone()
+        if row:
+            return {'variants': json.loads(row['image_variants']), 'image_hash': row['image_hash']}
+    return None
+
+def image_in_use(image_path):
+    """Whether any item still references a stored image."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT 1 FROM image_ref WHERE image_path = ?', (image_path,))
+    return cur.fetchone() is not None
+
+def iter_referenced_image_paths():
+    """Yield each image_path used by an item or an unfinished job, streaming the rows."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT image_path FROM lost_found_item WHERE image_path IS NOT NULL
+        UNION
+        SELECT image_path FROM marketplace_item WHERE image_path IS NOT NULL
+        UNION
+        SELECT image_path FROM image_job WHERE status IN ('pending', 'running')
+        UNION
+        SELECT replaced_path FROM image_job WHERE status IN ('pending', 'running') AND replaced_path IS NOT NULL
+    ''')
+    for row in cur:
+        yield row[0]
+
+def get_unfinished_raw_paths():
+    """Get the raw uploads that pending or running jobs still need."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT raw_path FROM image_job WHERE status IN ('pending', 'running')")
+    return {row['raw_path'] for row in cur.fetchall()}
+
+def get_resumable_image_jobs(stale_seconds):
+    """Get pending jobs plus running ones not touched for ``stale_seconds`` (their worker died).
+
+    Stale running jobs are put back to pending so they can be claimed again.
+    """
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE image_job SET status = 'pending'
+            WHERE status = 'running' AND updated_at < datetime('now', ?)
+        ''', (f'-{int(stale_seconds)} seconds',))
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM image_job WHERE status = 'pending' ORDER BY id")
+        return [row['id'] for row in cur.fetchall()]
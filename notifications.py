@@ -0,0 +1,69 @@
+"""Queued notifications for users.
+
+Anything that wants to tell a user about an item (a saved search it
+matched, a found report that looks like their lost one) calls ``notify``.
+The notifications are stored in the ``notification`` table, where the
+navigation bar's unread count and the alerts page pick them up, so users
+learn about new items without reloading the dashboards.  With NOTIFY_EMAIL
+set, each newly queued notification is also emailed from a background
+thread, off the request that queued it.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from flask_mail import Message
+
+import models
+from config import MAIL_USERNAME
+from extensions import mail
+
+logger = logging.getLogger('campus_hub.notifications')
+
+NOTIFY_EMAIL = os.environ.get('NOTIFY_EMAIL') == '1'
+ITEM_ENDPOINTS = {'lost_found': 'lost_and_found.item_detail', 'marketplace': 'marketplace.item_detail'}
+EMAIL_SUBJECTS = {
+    'match': 'A found item may be yours',
+    'saved_search': 'New item matching your saved search',
+}
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notify')
+
+
+def item_url(item_type, item_id, external=False):
+    """URL of the item a notification is about."""
+    return url_for(ITEM_ENDPOINTS[item_type], item_id=item_id, _external=external)
+
+
+def notify(notifications):
+    """Queue notifications, each a dict of user_id, kind, item_type, item_id and message.
+
+    Must be called inside a request, which builds the links for any emails.
+    """
+    try:
+        queued = models.queue_notifications(notifications)
+    except Exception:
+        logger.exception('Queueing %s notifications failed', len(notifications))
+        return []
+    if NOTIFY_EMAIL and queued:
+        messages = []
+        for note in queued:
+            user = models.get_user_by_id(note['user_id'])
+            if not user or not user.get('email'):
+                continue
+            msg = Message(EMAIL_SUBJECTS.get(note['kind'], 'Campus Hub notification'),
+                          sender=MAIL_USERNAME, recipients=[user['email']])
+            msg.body = f"{note['message']}\n\nSee it here: {item_url(note['item_type'], note['item_id'], external=True)}"
+            messages.append(msg)
+        _executor.submit(_send, current_app._get_current_object(), messages)
+    return queued
+
+
+def _send(app, messages):
+    with app.app_context():
+        for msg in messages:
+            try:
+                mail.send(msg)
+            except Exception as e:
+                logger.warning('Could not send notification email to %s: %s', msg.recipients, e)
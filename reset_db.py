@@ -25,7 +25,7 @@ def reset_database():
         cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = [table[0] for table in cur.fetchall()]
         print(f"Created tables: {tables}")
-        conn.close()
+        models.close_db_connection()
         
         return True
     except Exception as e:
@@ -0,0 +1,155 @@
+"""Saved searches, checked against every new item as it is created.
+
+A saved search is a dashboard search a user wants to hear about: keywords
+(each of which must start a word of the item's name, description, location
+or category, as in the dashboard's prefix search, so "calc" matches
+"Calculus textbook"), an optional category and status, and for lost & found
+an optional circle around a point.  ``check_item`` runs once per new item
+and queues a notification for the owner of each search it satisfies.
+
+Rather than testing every saved search, each one is filed under keys its
+matches are bound to carry: the first KEY_PREFIX_LENGTH characters of its
+longest keyword (the rarest, as a rule of thumb), otherwise its category,
+otherwise its status, otherwise the GEO_CELL_DEGREES grid cells its circle
+overlaps, otherwise the catch-all '*'.  An item looks up the keys it carries
+(the leading characters of each of its tokens, its category, status and
+grid cell, and '*') in that index, so only searches sharing something
+selective with it are fetched, and only those have their full predicate
+checked.
+"""
+import logging
+
+import models
+import notifications
+import tokens
+
+logger = logging.getLogger('campus_hub.saved_searches')
+
+SAVED_SEARCH_TOKEN_LIMIT = 8
+# Leading characters of a keyword its index key keeps; an item probes every
+# prefix of its tokens up to this length
+KEY_PREFIX_LENGTH = 6
+ITEM_TYPES = ('lost_found', 'marketplace')
+ANY_KEY = '*'
+
+
+def cell_key(cell):
+    """The index key of a models.geo_cell grid cell."""
+    return 'g:%d:%d' % cell
+
+
+def search_keys(search_tokens, category, status, latitude=None, longitude=None, radius_m=None):
+    """The index keys a search is filed under; every item it matches carries one of them."""
+    if search_tokens:
+        return ['p:' + max(search_tokens, key=len)[:KEY_PREFIX_LENGTH]]
+    if category:
+        return ['c:' + category]
+    if status:
+        return ['s:' + status]
+    if radius_m:
+        cells = models.geo_cells(latitude, longitude, radius_m)
+        if cells:
+            return [cell_key(cell) for cell in cells]
+    return [ANY_KEY]
+
+
+def item_tokens(item):
+    """The tokens keywords are matched against, from the same fields the dashboard search covers."""
+    return tokens.tokenize(item['name'], item.get('description'), item.get('location'), item.get('category'))
+
+
+def item_keys(item, words):
+    """Every key a search that ``item`` satisfies could be filed under."""
+    keys = {ANY_KEY}
+    for token in words:
+        keys.update('p:' + token[:length]
+                    for length in range(tokens.MIN_TOKEN_LENGTH, min(len(token), KEY_PREFIX_LENGTH) + 1))
+    if item.get('category'):
+        keys.add('c:' + item['category'])
+    if item.get('status'):
+        keys.add('s:' + item['status'])
+    if models.has_location(item):
+        keys.add(cell_key(models.geo_cell(item['latitude'], item['longitude'])))
+    return list(keys)
+
+
+def search_matches(search, item, words):
+    """Whether ``item`` satisfies every part of ``search``."""
+    if search['category'] and search['category'] != item.get('category'):
+        return False
+    if search['status'] and search['status'] != item.get('status'):
+        return False
+    wanted = tokens.tokenize(search['query'], limit=SAVED_SEARCH_TOKEN_LIMIT)
+    if not all(any(word.startswith(prefix) for word in words) for prefix in wanted):
+        return False
+    if search['radius_m'] is not None:
+        if not models.has_location(item):
+            return False
+        distance = models.haversine_m(search['latitude'], search['longitude'], item['latitude'], item['longitude'])
+        if distance > search['radius_m']:
+            return False
+    return True
+
+
+def save_search(user_id, item_type, query=None, category=None, status=None,
+                latitude=None, longitude=None, radius_m=None):
+    """Save a search for ``user_id``; return its id, or False if it could not be saved."""
+    if item_type not in ITEM_TYPES:
+        return False
+    if latitude is None or longitude is None or not radius_m:
+        latitude = longitude = radius_m = None
+    search = {
+        'user_id': user_id,
+        'item_type': item_type,
+        'query': (query or '').strip() or None,
+        'category': category or None,
+        'status': status or None,
+        'latitude': latitude,
+        'longitude': longitude,
+        'radius_m': radius_m,
+    }
+    keys = search_keys(tokens.tokenize(search['query'], limit=SAVED_SEARCH_TOKEN_LIMIT),
+                       search['category'], search['status'], latitude, longitude, radius_m)
+    return models.create_saved_search(search, keys)
+
+
+def matching_searches(item_type, item):
+    """Get the saved searches of other users that ``item`` satisfies."""
+    words = item_tokens(item)
+    candidates = models.get_candidate_searches(item_type, item_keys(item, words))
+    return [search for search in candidates
+            if search['user_id'] != item['user_id'] and search_matches(search, item, words)]
+
+
+def check_item(item_type, item_id):
+    """Notify the owners of saved searches a newly created item satisfies; return how many were queued."""
+    try:
+        item = (models.get_lost_found_item(item_id) if item_type == 'lost_found'
+                else models.get_marketplace_item(item_id))
+        if not item:
+            return 0
+        notes = [{
+            'user_id': search['user_id'],
+            'kind': 'saved_search',
+            'item_type': item_type,
+            'item_id': item_id,
+            'message': f"\"{item['name']}\" matches your saved search: {describe(search)}.",
+        } for search in matching_searches(item_type, item)]
+    except Exception:
+        logger.exception('Checking saved searches for %s item %s failed', item_type, item_id)
+        return 0
+    return len(notifications.notify(notes)) if notes else 0
+
+
+def describe(search):
+    """A short human-readable summary of a saved search."""
+    parts = []
+    if search['query']:
+        parts.append(f"\"{search['query']}\"")
+    if search['status']:
+        parts.append(search['status'].capitalize())
+    if search['category']:
+        parts.append(f"in {search['category']}")
+    if search['radius_m']:
+        parts.append(f"within {search['radius_m'] / 1000:g} km")
+    return ', '.join(parts) or 'Any new item'
@@ -0,0 +1,48 @@
+"""Normalised word tokens for matching item text.
+
+Text is case-folded and stripped of accents, split into runs of letters and
+digits, and reduced to a crude singular form so "Keys" and "key" or
+"bottles" and "bottle" meet.  Stop words, and words that say nothing about
+the object itself ("lost", "found", "item"), are dropped.
+"""
+import re
+import unicodedata
+
+STOPWORDS = frozenset('''
+    a an and are as at be been but by for from has have i in is it its me my near of on or our
+    please the their there this to was were while with you your
+    lost found item items someone somewhere left around
+'''.split())
+MIN_TOKEN_LENGTH = 2
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    """Lower-case ``text`` and strip accents."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def stem(word):
+    """Reduce a plural to its singular form; leave anything else alone."""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(*texts, limit=None):
+    """Distinct tokens of ``texts`` in order of first appearance, at most ``limit`` of them."""
+    seen = {}
+    for text in texts:
+        for word in _WORD.findall(normalize(text)):
+            if len(word) < MIN_TOKEN_LENGTH or word in STOPWORDS:
+                continue
+            seen.setdefault(stem(word), None)
+            if limit and len(seen) >= limit:
+                return list(seen)
+    return list(seen)